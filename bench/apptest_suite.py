@@ -0,0 +1,180 @@
+"""Rerun latency of medtimer.py driven headlessly with Streamlit's AppTest.
+
+For each dataset size a seeded med_data.json is placed in the default
+profile's shard, then these scenarios are timed (milliseconds, median of
+--repeat runs where a scenario can be repeated):
+
+    cold_start     first Quick Add run with the process store cache cleared
+    steady_rerun   rerun with nothing changed
+    add_medicine   "Add Medicine" click
+    mark_taken     "Mark Taken" click on a listed dose
+    delete         "Delete" click on a listed dose
+    guided_step    one guided-mode step transition (median over steps 1-5)
+    restore        guided dashboard restore from an uploaded file of size entries
+
+AppTest always reruns the whole script, so button timings include the full
+page even where the browser would only rerun a fragment.
+
+Results go to --output as JSON. With --thresholds, any scenario slower than
+its threshold is reported and the exit status is 1; --update-thresholds
+rewrites that file from this run with --headroom.
+
+Run from the repository root:  python bench/apptest_suite.py [--sizes 10 1000 10000 100000]
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+import streamlit
+from streamlit.testing.v1 import AppTest
+
+from medcore.storage import DATA_FILE, DEFAULT_USER, clear_cache, new_id, shard_dir
+
+APP = os.path.join(ROOT, "medtimer.py")
+QUICK_ADD = "⚡ Quick Add (Advanced)"
+DEFAULT_SIZES = [10, 1000, 10000, 100000]
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def seed(size):
+    folder = shard_dir(DEFAULT_USER)
+    os.makedirs(folder, exist_ok=True)
+    entries = [{"id": new_id(), "country": "India", "state": "All India", "timezone": "Asia/Kolkata",
+                "disease": "Asthma", "medicine": f"Medicine {i}", "time": f"{i % 24:02d}:{i % 60:02d}",
+                "notes": "", "status": ["Due", "Taken", "Missed"][i % 3], "version": 1} for i in range(size)]
+    with open(os.path.join(folder, DATA_FILE), "w") as f:
+        json.dump(entries, f)
+
+
+def timed(action):
+    started = time.perf_counter()
+    action()
+    return (time.perf_counter() - started) * 1000
+
+
+def check(at):
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+    return at
+
+
+def first_key(at, prefix):
+    return next(button.key for button in at.button if button.key and button.key.startswith(prefix))
+
+
+def quick_add_scenarios(repeat):
+    results = {}
+    at = AppTest.from_file(APP, default_timeout=600)
+    at.session_state["app_mode"] = QUICK_ADD
+    clear_cache()
+    results["cold_start"] = timed(lambda: check(at.run()))
+    results["steady_rerun"] = statistics.median(timed(lambda: check(at.run())) for _ in range(repeat))
+    samples = []
+    for _ in range(repeat):
+        samples.append(timed(lambda: check(at.button(key="add_medicine_btn").click().run())))
+    results["add_medicine"] = statistics.median(samples)
+    samples = []
+    for _ in range(repeat):
+        key = first_key(at, "taken_quick_")
+        samples.append(timed(lambda: check(at.button(key=key).click().run())))
+    results["mark_taken"] = statistics.median(samples)
+    samples = []
+    for _ in range(repeat):
+        key = first_key(at, "delete_quick_")
+        samples.append(timed(lambda: check(at.button(key=key).click().run())))
+    results["delete"] = statistics.median(samples)
+    return results
+
+
+def guided_scenarios(size):
+    results = {}
+    at = check(AppTest.from_file(APP, default_timeout=600).run())
+    at.text_input(key="name_input").input("Benchmark").run()
+    steps = [timed(lambda: check(at.button(key=f"step{step}_next").click().run())) for step in range(1, 6)]
+    results["guided_step"] = statistics.median(steps)
+    payload = json.dumps({"profile": {"name": "Benchmark", "country": "India", "timezone": "Asia/Kolkata",
+                                      "disease": "Asthma"},
+                          "meds": [{"name": f"Medicine {i}", "time": "08:00"} for i in range(size)],
+                          "med_status": {}}).encode("utf-8")
+    uploader = at.get("file_uploader")
+    restore = next(widget for widget in uploader if widget.key == "restore")
+    results["restore"] = timed(lambda: check(restore.set_value(("medtimer_data.json", payload,
+                                                                 "application/json")).run()))
+    if len(at.session_state["meds"]) != size:
+        raise RuntimeError("restore did not load the uploaded medicines")
+    return results
+
+
+def run_size(size, repeat):
+    cwd = os.getcwd()
+    os.chdir(tempfile.mkdtemp(prefix=f"medtimer-bench-{size}-"))
+    try:
+        seed(size)
+        results = quick_add_scenarios(repeat)
+        results.update(guided_scenarios(size))
+    finally:
+        os.chdir(cwd)
+    return {name: round(value, 1) for name, value in results.items()}
+
+
+def compare(results, thresholds):
+    regressions = []
+    for size, scenarios in results.items():
+        for scenario, value in scenarios.items():
+            limit = thresholds.get(size, {}).get(scenario)
+            if limit is not None and value > limit:
+                regressions.append(f"{size} entries, {scenario}: {value} ms > {limit} ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default=os.path.join(HERE, "apptest_results.json"))
+    parser.add_argument("--thresholds", default=os.path.join(HERE, "apptest_thresholds.json"))
+    parser.add_argument("--update-thresholds", action="store_true")
+    parser.add_argument("--headroom", type=float, default=2.0, help="threshold = measured x headroom")
+    args = parser.parse_args()
+
+    results = {}
+    for size in args.sizes:
+        started = time.perf_counter()
+        results[str(size)] = run_size(size, args.repeat)
+        print(f"{size:>7} entries ({time.perf_counter() - started:.0f}s): "
+              + ", ".join(f"{name} {value:.0f}" for name, value in results[str(size)].items()) + " ms")
+
+    report = {"python": platform.python_version(), "streamlit": streamlit.__version__,
+              "platform": platform.platform(), "repeat": args.repeat, "results_ms": results}
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nresults written to {args.output}")
+
+    if args.update_thresholds:
+        thresholds = {size: {name: round(value * args.headroom, 1) for name, value in scenarios.items()}
+                      for size, scenarios in results.items()}
+        with open(args.thresholds, "w") as f:
+            json.dump(thresholds, f, indent=2)
+            f.write("\n")
+        print(f"thresholds written to {args.thresholds}")
+        return
+    if os.path.exists(args.thresholds):
+        with open(args.thresholds) as f:
+            regressions = compare(results, json.load(f))
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print("all scenarios within thresholds")
+
+
+if __name__ == "__main__":
+    main()
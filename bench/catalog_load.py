@@ -0,0 +1,74 @@
+"""Startup time and memory of the catalog: parsing the JSON eagerly versus
+opening the compiled snapshot and decoding only the countries a session uses.
+
+Builds a synthetic catalog (countries x conditions x medicines, with groups of
+countries sharing condition sets) in a temporary directory.
+
+Run from the repository root:  python bench/catalog_load.py [countries] [conditions]
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from medcore.catalog import compile_catalog, load_catalog
+
+SHARED_BY = 10
+
+
+def synthetic_catalog(countries, conditions):
+    sets = {f"set-{s}": {f"Condition {c}": [f"Medicine {s}-{c}-{m} {5 * (m + 1)}mg" for m in range(3)]
+                         for c in range(conditions)}
+            for s in range(max(1, countries // SHARED_BY))}
+    return {"condition_sets": sets,
+            "countries": {f"Country {n}": {"timezones": ["UTC"], "states": [f"Region {n}"],
+                                           "conditions": f"set-{n // SHARED_BY % len(sets)}"}
+                          for n in range(countries)}}
+
+
+def measure(label, load):
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = load()
+    elapsed = (time.perf_counter() - started) * 1000
+    memory = tracemalloc.get_traced_memory()[0] / 1024
+    tracemalloc.stop()
+    del result
+    print(f"{label:<38} {elapsed:>9.2f} ms {memory:>10.0f} KiB held")
+
+
+def main():
+    countries = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    conditions = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    folder = tempfile.mkdtemp(prefix="medtimer-catalog-")
+    source = os.path.join(folder, "catalog.json")
+    with open(source, "w") as f:
+        json.dump(synthetic_catalog(countries, conditions), f)
+    started = time.perf_counter()
+    load_catalog(source)
+    print(f"{countries} countries x {conditions} conditions, source {os.path.getsize(source) // 1024} KiB, "
+          f"compiled in {(time.perf_counter() - started) * 1000:.0f} ms "
+          f"to {len(compile_catalog(source)) // 1024} KiB\n")
+
+    def eager():
+        # What the old module-level literals amounted to: everything, per copy.
+        with open(source) as f:
+            data = json.load(f)
+        return {name: {k: list(v) for k, v in data["condition_sets"][country["conditions"]].items()}
+                for name, country in data["countries"].items()}
+
+    def lazy():
+        load_catalog.cache_clear()
+        catalog = load_catalog(source)
+        return catalog.conditions["Country 0"]
+
+    measure("eager JSON, copied per country", eager)
+    measure("snapshot, one country's conditions", lazy)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Many processes writing the same store at once; fails if any update is lost.
+
+Every worker increments a shared counter on one entry with compare-and-swap
+(retrying on conflict), marks its own entry Taken and deletes the same shared
+entries as every other worker. Afterwards the counter must equal
+workers * increments, every worker's entry must be Taken, the shared entries
+must be gone and the statistics must count each of them out exactly once. The
+JSON journal compacts every few kilobytes so compaction races with writers.
+
+Run from the repository root:  python bench/concurrent_writers.py [json|sqlite] [workers] [increments]
+"""
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from medcore.storage import DB_FILE, DATA_FILE, JOURNAL_FILE, STATS_FILE, JsonStore, SqliteStore
+
+COUNTER_ID = "counter"
+SHARED = 20
+
+
+def open_bench_store(backend, folder):
+    if backend == "sqlite":
+        return SqliteStore(os.path.join(folder, DB_FILE))
+    return JsonStore(os.path.join(folder, DATA_FILE), os.path.join(folder, JOURNAL_FILE), compact_bytes=4096,
+                     stats_path=os.path.join(folder, STATS_FILE))
+
+
+def entry(record_id, notes=""):
+    return {"id": record_id, "country": "India", "state": "All India", "timezone": "Asia/Kolkata",
+            "disease": "Asthma", "medicine": record_id, "time": "08:00", "notes": notes, "status": "Due"}
+
+
+def worker(backend, folder, number, increments, conflicts):
+    own = f"worker-{number}"
+    retries = 0
+    for _ in range(increments):
+        while True:
+            store = open_bench_store(backend, folder)
+            current = store.get(COUNTER_ID)["notes"]
+            if not store.update(COUNTER_ID, expect={"notes": current}, notes=str(int(current) + 1)):
+                break
+            retries += 1
+    store = open_bench_store(backend, folder)
+    store.update(own, expect={"status": "Due"}, status="Taken")
+    for n in range(SHARED):
+        store.delete(f"shared-{n}")
+    conflicts.put(retries)
+
+
+def main():
+    backend = sys.argv[1] if len(sys.argv) > 1 else "json"
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    increments = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+    folder = tempfile.mkdtemp(prefix="medtimer-bench-")
+    store = open_bench_store(backend, folder)
+    store.replace_all([entry(COUNTER_ID, "0")] + [entry(f"worker-{n}") for n in range(workers)]
+                      + [entry(f"shared-{n}") for n in range(SHARED)])
+
+    conflicts = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=worker, args=(backend, folder, n, increments, conflicts))
+                 for n in range(workers)]
+    started = time.perf_counter()
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - started
+    assert all(process.exitcode == 0 for process in processes), "a writer process failed"
+    retries = sum(conflicts.get() for _ in processes)
+
+    store = open_bench_store(backend, folder)
+    counter = int(store.get(COUNTER_ID)["notes"])
+    taken = sum(1 for n in range(workers) if store.get(f"worker-{n}")["status"] == "Taken")
+    print(f"{backend}: {workers} workers x {increments} increments in {elapsed:.2f}s, "
+          f"{retries} compare-and-swap retries")
+    left = sum(1 for n in range(SHARED) if store.get(f"shared-{n}") is not None)
+    print(f"counter {counter} / {workers * increments}, own entries Taken {taken} / {workers}, "
+          f"shared entries left {left} / {SHARED}")
+    assert counter == workers * increments, "lost counter updates"
+    assert taken == workers, "lost status updates"
+    assert left == 0, "shared entries survived their deletes"
+    counts = store.counts()
+    assert counts["Taken"] == workers, "statistics out of step with entries"
+    assert counts["total"] == workers + 1 == store.count_entries(), "deletes counted more than once"
+    print("no lost updates")
+
+
+if __name__ == "__main__":
+    main()
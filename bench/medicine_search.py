@@ -0,0 +1,57 @@
+"""Type-ahead latency over a formulary-sized medicine index.
+
+Builds a synthetic formulary (drug stems x suffixes x strengths, about 50k
+names by default) unless MEDTIMER_FORMULARY points at a real one, then times
+prefix, multi-word and misspelled queries.
+
+Run from the repository root:  python bench/medicine_search.py [names]
+"""
+import itertools
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from medcore.search import MedicineIndex, load_formulary
+
+STEMS = ["metfor", "amlodi", "atorva", "losar", "lisino", "sertra", "fluox", "bupro", "levothy", "predni",
+         "ibupro", "napro", "sumatr", "rizatr", "topira", "montel", "budeso", "salbut", "tiotro", "glimep",
+         "sitagl", "escita", "alpraz", "propra", "diclo", "parace", "hydroxy", "methot", "insul", "albut"]
+SUFFIXES = ["min", "pine", "statin", "tan", "pril", "line", "etine", "pion", "xine", "sone", "fen", "xen",
+            "iptan", "mate", "kast", "nide", "amol", "pium", "ride", "gliptin", "lopram", "zolam", "nolol",
+            "fenac", "tamol", "quine", "trexate", "ulin", "terol", "zole"]
+FORMS = ["", " XR", " ER", " SR", " ODT", " Inhaler", " Oral Solution", " Injection"]
+STRENGTHS = ["1mg", "2.5mg", "5mg", "10mg", "20mg", "25mg", "40mg", "50mg", "100mg", "250mg", "500mg"]
+QUERIES = ["met", "metformin", "metformin 500", "amlodipine 5", "ator", "ibuprofen 400", "xr 10",
+           "metfromin", "amlodopine", "sertralin 50mg", "budesonide inhaler", "zzzz", "a"]
+
+
+def synthetic_formulary(count):
+    names = [f"{stem}{suffix}{form} {strength}".capitalize()
+             for stem, suffix, form, strength in itertools.product(STEMS, SUFFIXES, FORMS, STRENGTHS)]
+    random.Random(7).shuffle(names)
+    return names[:count]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    path = os.environ.get("MEDTIMER_FORMULARY")
+    names = load_formulary(path) if path else synthetic_formulary(count)
+    started = time.perf_counter()
+    index = MedicineIndex(names)
+    print(f"built index over {len(index)} names in {time.perf_counter() - started:.2f}s\n")
+    print(f"{'query':<22} {'median ms':>10} {'max ms':>8}  top match")
+    for query in QUERIES:
+        timings = []
+        for _ in range(50):
+            started = time.perf_counter()
+            results = index.search(query, k=10)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        print(f"{query:<22} {timings[len(timings) // 2]:>10.3f} {timings[-1]:>8.3f}  {results[0] if results else '-'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+"""Bytes of stylesheet sent to the browser per rerun, before and after
+compiling the theme stylesheets.
+
+Run from the repository root:  python bench/stylesheet_payload.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from medcore.themes import FONT_SIZES, THEMES, compile_stylesheet, render_stylesheet, stylesheet_injector
+
+
+def main():
+    print(f"{'theme':<22} {'size':>4} {'before':>8} {'compiled':>9} {'steady':>7}")
+    for theme_name in THEMES:
+        for font_size in FONT_SIZES:
+            before = len(render_stylesheet(THEMES[theme_name], font_size).encode("utf-8"))
+            digest, css = compile_stylesheet(theme_name, font_size)
+            compiled = len(stylesheet_injector(digest, css).encode("utf-8"))
+            print(f"{theme_name.encode('ascii', 'ignore').decode().strip():<22} {font_size:>4} "
+                  f"{before:>8} {compiled:>9} {0:>7}")
+    print("\nbefore:   the full <style> block re-sent on every rerun")
+    print("compiled: minified stylesheet, sent only when the theme or text size changes")
+    print("steady:   bytes per rerun while the theme and text size stay the same")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+"""Headless MedTimer logic shared by the Streamlit app and scripts.
+
+Nothing in this package imports Streamlit, and pandas/numpy are only
+imported by the functions that need them, so scripts and the batch CLI
+(python -m medcore) start quickly.
+"""
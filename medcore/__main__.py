@@ -0,0 +1,139 @@
+"""Batch operations on MedTimer data without Streamlit.
+
+    python -m medcore [--user NAME | --all-users | --global] COMMAND
+
+    import FILE                 add the entries of a JSON backup, CSV or NDJSON file
+    mark [ID ...] --status S    set a status, by id or by --where-status/--medicine
+    report [--json]             status totals per store
+    compact                     compact journals and seal finished history months
+
+Stores are the per-user shards the app uses (--user, default "default"),
+every shard under --root (--all-users), or the old global med_data.json
+(--global). As in the app, a global file not yet split into shards is split
+the first time a sharded store is opened. Only storage and statistics are imported up front; pandas is
+loaded only if history partitions need sealing.
+"""
+import argparse
+import json
+import os
+import sys
+
+from medcore.history import HISTORY_DIR, record_event, seal_partitions
+from medcore.importer import FORMATS, detect_format, import_rows
+from medcore.storage import DEFAULT_USER, SHARD_ROOT, open_shard, open_store, shard_dir, shard_folders, split_legacy_store
+
+STATUSES = ["Due", "Taken", "Missed"]
+
+
+def targets(args):
+    """(label, store, history root) for every store the command applies to."""
+    if args.use_global:
+        yield "global", open_store(args.backend), HISTORY_DIR
+    elif args.all_users:
+        split_legacy_store(args.backend, args.root)
+        for folder in shard_folders(args.root):
+            yield os.path.basename(folder)[:12], open_shard(folder, args.backend), os.path.join(folder, HISTORY_DIR)
+    else:
+        # Like the app, the first sharded open splits an old global store.
+        store = open_store(args.backend, user=args.user, root=args.root)
+        yield args.user, store, os.path.join(shard_dir(args.user, args.root), HISTORY_DIR)
+
+
+def import_entries(args):
+    # Files without a known extension are read as a JSON list of entries.
+    fmt = detect_format(args.file) if args.file.lower().endswith(tuple(FORMATS)) else "json"
+    for label, store, _ in targets(args):
+        with open(args.file, "rb") as f:
+            try:
+                report = import_rows(store, f, fmt)
+            except ValueError as e:
+                sys.exit(f"{args.file}: {e}")
+        for number, error in report["errors"]:
+            print(f"{args.file}:{number}: {error}", file=sys.stderr)
+        print(f"{label}: imported {report['imported']} of {report['rows']} rows"
+              + (f", {report['error_count']} rejected" if report["error_count"] else ""))
+
+
+def mark(args):
+    if not (args.ids or args.where_status or args.medicine):
+        sys.exit("mark: give entry ids, --where-status or --medicine")
+    for label, store, history_root in targets(args):
+        if args.ids:
+            selected = [entry for entry in map(store.get, args.ids) if entry is not None]
+        else:
+            selected = [entry for entry in store.entries()
+                        if (args.where_status is None or entry["status"] == args.where_status)
+                        and (args.medicine is None or entry["medicine"] == args.medicine)]
+        marked = conflicts = 0
+        for entry in selected:
+            previous = entry["status"]
+            if previous == args.status:
+                continue
+            if store.update(entry["id"], expect={"status": previous}, status=args.status):
+                conflicts += 1
+                continue
+            record_event(entry["id"], entry["medicine"], args.status, previous=previous, source="cli",
+                         root=history_root)
+            marked += 1
+        print(f"{label}: marked {marked} {args.status}" + (f", {conflicts} changed meanwhile" if conflicts else ""))
+
+
+def report(args):
+    totals = {"total": 0, "Taken": 0, "Missed": 0, "Due": 0}
+    stores = {}
+    for label, store, _ in targets(args):
+        counts = store.counts()
+        stores[label] = dict(counts, by_condition=dict(store.stats()["disease"]))
+        for key in totals:
+            totals[key] += counts.get(key, 0)
+        if not args.json:
+            print(f"{label}: {counts['total']} medicines, {counts['Taken']} taken, "
+                  f"{counts['Missed']} missed, {counts['Due']} due")
+    if args.json:
+        print(json.dumps({"stores": stores, "totals": totals}, indent=2))
+    elif len(stores) > 1:
+        print(f"all {len(stores)} stores: {totals['total']} medicines, {totals['Taken']} taken, "
+              f"{totals['Missed']} missed, {totals['Due']} due")
+
+
+def compact(args):
+    for label, store, history_root in targets(args):
+        store.compact()
+        sealed = seal_partitions(history_root)
+        print(f"{label}: compacted" + (f", sealed {len(sealed)} history months" if sealed else ""))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m medcore", description="Batch operations on MedTimer data.")
+    parser.add_argument("--backend", choices=["json", "sqlite"], help="default: MEDTIMER_STORAGE or json")
+    parser.add_argument("--root", default=SHARD_ROOT, help="directory holding the per-user shards")
+    which = parser.add_mutually_exclusive_group()
+    which.add_argument("--user", default=DEFAULT_USER, help="profile name (default: %(default)s)")
+    which.add_argument("--all-users", action="store_true", help="every shard under --root")
+    which.add_argument("--global", dest="use_global", action="store_true", help="the unsharded med_data.json")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("import", help="add the entries of a JSON backup, CSV or NDJSON file")
+    command.add_argument("file")
+    command.set_defaults(run=import_entries)
+
+    command = commands.add_parser("mark", help="set the status of entries")
+    command.add_argument("ids", nargs="*", help="entry ids")
+    command.add_argument("--status", required=True, choices=STATUSES)
+    command.add_argument("--where-status", choices=STATUSES, help="only entries with this status")
+    command.add_argument("--medicine", help="only entries for this medicine")
+    command.set_defaults(run=mark)
+
+    command = commands.add_parser("report", help="status totals per store")
+    command.add_argument("--json", action="store_true")
+    command.set_defaults(run=report)
+
+    command = commands.add_parser("compact", help="compact journals and seal finished history months")
+    command.set_defaults(run=compact)
+
+    args = parser.parse_args(argv)
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
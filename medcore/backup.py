@@ -0,0 +1,63 @@
+"""Guided-mode backups: {"profile": {...}, "meds": [...], "med_status": {...}}.
+
+Uploads are identified by the SHA-256 of their bytes, so the app can apply
+each file once even though the uploader hands it back on every rerun.
+Backups can replace the session's data or be merged into it; merging
+matches medicines by name, the key med_status already uses.
+"""
+import gzip
+import hashlib
+import json
+
+from medcore.recurrence import TIME_PATTERN, validate_rule
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def parse_backup(data):
+    """The backup dict from uploaded bytes (plain or gzipped JSON)."""
+    if data[:2] == b"\x1f\x8b":
+        data = gzip.decompress(data)
+    loaded = json.loads(data)
+    if not isinstance(loaded, dict) or not isinstance(loaded.get("profile"), dict) \
+            or not isinstance(loaded.get("meds"), list):
+        raise ValueError("not a MedTimer backup (expected profile and meds)")
+    for med in loaded["meds"]:
+        if not isinstance(med, dict) or not isinstance(med.get("name"), str) \
+                or not isinstance(med.get("time"), str) or not TIME_PATTERN.match(med["time"]):
+            raise ValueError("every medicine needs a name and an HH:MM time")
+        if med.get("rule") is None:
+            med.pop("rule", None)
+        else:
+            validate_rule(med["rule"])
+    loaded.setdefault("med_status", {})
+    if not isinstance(loaded["med_status"], dict):
+        raise ValueError("med_status must map medicine names to statuses")
+    return loaded
+
+
+def merge_backup(profile, meds, med_status, backup):
+    """Fold backup into the current data; returns (profile, meds, med_status, added, updated).
+
+    Medicines already present keep their place and take the backup's time;
+    new ones are appended. The backup only fills in profile fields that are
+    still empty, while its statuses override the current ones.
+    """
+    meds = [dict(med) for med in meds]
+    positions = {}
+    for i, med in enumerate(meds):
+        positions.setdefault(med["name"], i)
+    added = updated = 0
+    for med in backup["meds"]:
+        i = positions.get(med["name"])
+        if i is None:
+            positions[med["name"]] = len(meds)
+            meds.append(dict(med))
+            added += 1
+        elif any(meds[i].get(key) != value for key, value in med.items()):
+            meds[i].update(med)
+            updated += 1
+    profile = dict(backup["profile"], **{key: value for key, value in profile.items() if value})
+    return profile, meds, dict(med_status, **backup["med_status"]), added, updated
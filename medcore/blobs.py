@@ -0,0 +1,156 @@
+"""Uploaded prescriptions, stored by content.
+
+Each user's prescriptions live under their shard directory:
+
+    prescriptions/blobs/ab/<sha256>     the uploaded bytes
+    prescriptions/meta/<sha256>.json    name, type, size, upload time, preview
+    prescriptions/thumbs/<sha256>.png   thumbnail, when one could be made
+
+Uploading the same file again stores nothing new. Previews (an image
+thumbnail, or the page count of a PDF) are made in a shared thread pool so
+decoding a large upload never blocks the Streamlit script thread (file I/O
+and Pillow's decoding release the GIL); until a preview is done the file's
+meta has "preview": "pending". Thumbnails need
+Pillow; without it images are listed without one.
+"""
+import hashlib
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from medcore.storage import read_json, shard_dir, write_json_atomic
+
+PRESCRIPTION_DIR = "prescriptions"
+THUMBNAIL_SIZE = (320, 320)
+PREVIEW_WORKERS = 2
+
+_pool = None
+_pool_lock = threading.Lock()
+_in_flight = set()
+
+
+def prescription_root(user):
+    if user is None:
+        return PRESCRIPTION_DIR
+    return os.path.join(shard_dir(user), PRESCRIPTION_DIR)
+
+
+def make_preview(path, thumb_path, mime):
+    """Runs in a pool thread: {"pages": n or None, "thumbnail": bool}."""
+    if mime == "application/pdf":
+        with open(path, "rb") as f:
+            data = f.read()
+        # Page objects, or failing that (compressed object streams) the
+        # largest /Count of a page tree node.
+        pages = len(re.findall(rb"/Type\s*/Page(?![s\w])", data))
+        if not pages:
+            pages = max((int(count) for count in re.findall(rb"/Count\s+(\d+)", data)), default=0)
+        return {"pages": pages or None, "thumbnail": False}
+    try:
+        from PIL import Image
+    except ImportError:
+        return {"pages": None, "thumbnail": False}
+    try:
+        with Image.open(path) as image:
+            image.thumbnail(THUMBNAIL_SIZE)
+            tmp_path = f"{thumb_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            image.convert("RGB").save(tmp_path, "PNG")
+        os.replace(tmp_path, thumb_path)
+    except (OSError, ValueError):
+        return {"pages": None, "thumbnail": False}
+    return {"pages": 1, "thumbnail": True}
+
+
+def _preview_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(PREVIEW_WORKERS, thread_name_prefix="medtimer-preview")
+        return _pool
+
+
+class BlobStore:
+    def __init__(self, root=PRESCRIPTION_DIR):
+        self.root = root
+
+    def blob_path(self, digest):
+        return os.path.join(self.root, "blobs", digest[:2], digest)
+
+    def meta_path(self, digest):
+        return os.path.join(self.root, "meta", digest + ".json")
+
+    def thumbnail_path(self, digest):
+        return os.path.join(self.root, "thumbs", digest + ".png")
+
+    def put(self, data, name, mime=None):
+        """Store data; returns (digest, True) or (digest, False) if already stored."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.blob_path(digest)
+        if os.path.exists(self.meta_path(digest)):
+            return digest, False
+        for folder in (os.path.dirname(path), os.path.dirname(self.meta_path(digest))):
+            os.makedirs(folder, exist_ok=True)
+        if not os.path.exists(path):
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        write_json_atomic(self.meta_path(digest), {
+            "digest": digest, "name": name, "mime": mime or "", "size": len(data),
+            "uploaded": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "preview": "pending", "pages": None})
+        return digest, True
+
+    def get(self, digest):
+        meta = read_json(self.meta_path(digest))
+        return meta if isinstance(meta, dict) and meta else None
+
+    def read(self, digest):
+        with open(self.blob_path(digest), "rb") as f:
+            return f.read()
+
+    def items(self):
+        """Metadata of every stored file, newest first."""
+        folder = os.path.join(self.root, "meta")
+        if not os.path.isdir(folder):
+            return []
+        found = [self.get(name[:-5]) for name in os.listdir(folder) if name.endswith(".json")]
+        return sorted((meta for meta in found if meta), key=lambda meta: meta["uploaded"], reverse=True)
+
+    def delete(self, digest):
+        for path in (self.meta_path(digest), self.blob_path(digest), self.thumbnail_path(digest)):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _preview_done(self, key, digest, future):
+        try:
+            result = future.result()
+        except Exception:
+            result = {"pages": None, "thumbnail": False}
+        meta = self.get(digest)
+        if meta is not None:
+            meta.update(result, preview="done")
+            write_json_atomic(self.meta_path(digest), meta)
+        with _pool_lock:
+            _in_flight.discard(key)
+
+    def request_previews(self, items):
+        """Queue a preview for every pending item not already being made.
+
+        Also picks up items left pending by a server that stopped midway.
+        """
+        for meta in items:
+            if meta.get("preview") != "pending":
+                continue
+            key = os.path.abspath(self.blob_path(meta["digest"]))
+            pool = _preview_pool()
+            with _pool_lock:
+                if key in _in_flight:
+                    continue
+                _in_flight.add(key)
+            thumb_path = os.path.abspath(self.thumbnail_path(meta["digest"]))
+            os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+            future = pool.submit(make_preview, key, thumb_path, meta["mime"])
+            future.add_done_callback(lambda done, key=key, digest=meta["digest"]: self._preview_done(key, digest, done))
@@ -0,0 +1,181 @@
+"""Country, condition and medicine catalog.
+
+The catalog is edited as JSON (data/catalog.json): each country names the
+condition set it uses, so countries that prescribe alike share one set. At
+first use it is compiled into a binary snapshot next to the source:
+
+    MAGIC | header length | header | country and condition-set records
+
+The header only lists names and byte ranges; a country's record, and the
+condition set it points to, are decoded the first time they are looked up.
+Records are immutable tuples and read-only mappings, and a condition set is
+decoded once no matter how many countries use it, so countries share it
+without being able to change each other's lists.
+"""
+import json
+import marshal
+import mmap
+import os
+import struct
+import sys
+from collections.abc import Mapping
+from functools import lru_cache
+from types import MappingProxyType
+
+CATALOG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "catalog.json")
+MAGIC = b"MEDCAT1\n"
+_LENGTH = struct.Struct("<Q")
+
+
+def _source_key(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _interned(values):
+    return tuple(sys.intern(value) for value in values)
+
+
+def compile_catalog(source=CATALOG_FILE):
+    """Compile the JSON catalog into snapshot bytes."""
+    with open(source, encoding="utf-8") as f:
+        data = json.load(f)
+    records = []
+    offset = 0
+
+    def add(record):
+        nonlocal offset
+        blob = marshal.dumps(record)
+        records.append(blob)
+        offset += len(blob)
+        return (offset - len(blob), len(blob))
+
+    sets = {name: add(tuple((condition, tuple(medicines)) for condition, medicines in conditions.items()))
+            for name, conditions in data["condition_sets"].items()}
+    countries = tuple((name, *add((tuple(country["timezones"]), tuple(country["states"]), country["conditions"])))
+                      for name, country in data["countries"].items())
+    header = marshal.dumps({"source": _source_key(source), "countries": countries, "condition_sets": sets})
+    return MAGIC + _LENGTH.pack(len(header)) + header + b"".join(records)
+
+
+def _snapshot_path(source):
+    return os.path.splitext(source)[0] + ".bin"
+
+
+def _read_snapshot(path):
+    try:
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return None
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except FileNotFoundError:
+        return None
+
+
+def _write_snapshot(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+    return True
+
+
+class _LazyMapping(Mapping):
+    def __init__(self, names, load):
+        self._names = names
+        self._load = load
+        self._loaded = {}
+
+    def __getitem__(self, name):
+        value = self._loaded.get(name)
+        if value is None:
+            if name not in self._names:
+                raise KeyError(name)
+            value = self._loaded[name] = self._load(name)
+        return value
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __len__(self):
+        return len(self._names)
+
+
+class Catalog:
+    """Lazily decoded view of a compiled catalog snapshot.
+
+    countries maps a country to {"timezones": (...), "states": (...)} and
+    conditions maps a country to {condition: (medicine, ...)}.
+    """
+
+    def __init__(self, snapshot):
+        if snapshot[:len(MAGIC)] != MAGIC:
+            raise ValueError("not a MedTimer catalog snapshot")
+        start = len(MAGIC) + _LENGTH.size
+        header_length = _LENGTH.unpack_from(snapshot, len(MAGIC))[0]
+        header = marshal.loads(snapshot[start:start + header_length])
+        self.source = header["source"]
+        self._data = snapshot
+        self._base = start + header_length
+        self._country_ranges = {name: (offset, length) for name, offset, length in header["countries"]}
+        self._set_ranges = header["condition_sets"]
+        self._sets = {}
+        self._medicines = None
+        self.countries = _LazyMapping(dict.fromkeys(self._country_ranges), self._load_country)
+        self.conditions = _LazyMapping(self.countries._names, self._load_conditions)
+
+    def _record(self, offset, length):
+        return marshal.loads(self._data[self._base + offset:self._base + offset + length])
+
+    def _load_country(self, name):
+        timezones, states, condition_set = self._record(*self._country_ranges[name])
+        return MappingProxyType({"timezones": _interned(timezones), "states": _interned(states),
+                                 "conditions": condition_set})
+
+    def condition_set(self, name):
+        conditions = self._sets.get(name)
+        if conditions is None:
+            conditions = self._sets[name] = MappingProxyType(
+                {sys.intern(condition): _interned(medicines)
+                 for condition, medicines in self._record(*self._set_ranges[name])})
+        return conditions
+
+    def _load_conditions(self, country):
+        return self.condition_set(self.countries[country]["conditions"])
+
+    def medicines(self):
+        """Every medicine in the catalog, once each."""
+        if self._medicines is None:
+            self._medicines = tuple(sorted({medicine for name in self._set_ranges
+                                            for medicines in self.condition_set(name).values()
+                                            for medicine in medicines}))
+        return self._medicines
+
+
+@lru_cache(maxsize=None)
+def load_catalog(source=CATALOG_FILE):
+    """The process-wide catalog, recompiling the snapshot if the source changed."""
+    snapshot_path = _snapshot_path(source)
+    snapshot = _read_snapshot(snapshot_path)
+    if snapshot is not None:
+        try:
+            catalog = Catalog(snapshot)
+        except ValueError:
+            catalog = None
+        if catalog is not None and (catalog.source == _source_key(source) or not os.path.exists(source)):
+            return catalog
+    data = compile_catalog(source)
+    if _write_snapshot(snapshot_path, data):
+        snapshot = _read_snapshot(snapshot_path)
+        if snapshot is not None:
+            return Catalog(snapshot)
+    # Read-only install: keep the compiled bytes in memory instead.
+    return Catalog(data)
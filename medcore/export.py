@@ -0,0 +1,76 @@
+"""Streaming exports for the download buttons.
+
+export_file() serializes records one at a time into a temporary file
+(optionally through gzip), so an export is never built up as one large
+string next to the data it came from. records can be any iterable, or a
+function returning one (e.g. store.iter_entries) so nothing is read until
+the export runs; for JSON a dict is written as a single document instead,
+which is how the guided backup is saved.
+"""
+import csv
+import gzip
+import io
+import json
+import tempfile
+
+FORMATS = {"JSON": ("json", "application/json"), "NDJSON": ("ndjson", "application/x-ndjson"),
+           "CSV": ("csv", "text/csv")}
+CHUNK_CHARS = 64 * 1024
+
+
+def _compact(record):
+    return json.dumps(record, separators=(",", ":"))
+
+
+def iter_chunks(records, fmt, columns=None):
+    """Text chunks of records serialized as json, ndjson or csv."""
+    if fmt == "json":
+        if isinstance(records, dict):
+            yield _compact(records)
+            return
+        yield "["
+        for i, record in enumerate(records):
+            yield ("," if i else "") + _compact(record)
+        yield "]"
+    elif fmt == "ndjson":
+        for record in records:
+            yield _compact(record) + "\n"
+    else:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        for record in records:
+            writer.writerow([_compact(value) if isinstance(value, (dict, list)) else value
+                             for value in (record.get(column, "") for column in columns)])
+            if buffer.tell() >= CHUNK_CHARS:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+
+def export_file(records, fmt, columns=None, compress=False):
+    """A temporary binary file holding the export, positioned at the start."""
+    if callable(records):
+        records = records()
+    f = tempfile.TemporaryFile()
+    out = gzip.GzipFile(fileobj=f, mode="wb", mtime=0) if compress else f
+    text = io.TextIOWrapper(out, encoding="utf-8", newline="")
+    for chunk in iter_chunks(records, fmt, columns):
+        text.write(chunk)
+    text.flush()
+    text.detach()
+    if compress:
+        out.close()
+    f.seek(0)
+    return f
+
+
+def export_name(base, fmt, compress=False):
+    return f"{base}.{fmt}" + (".gz" if compress else "")
+
+
+def export_mime(fmt, compress=False):
+    if compress:
+        return "application/gzip"
+    return next(mime for extension, mime in FORMATS.values() if extension == fmt)
@@ -0,0 +1,181 @@
+"""Dose-event history, partitioned by month.
+
+Every status transition is appended to the current month's partition,
+history/YYYY-MM.csv. Once a month is over, its partition is sealed into a
+compressed columnar file (Parquet when pyarrow is installed, gzip CSV
+otherwise) and never touched again. Range queries only open the partitions
+whose month overlaps the range. Each user's history lives in their own
+shard directory (see user_root).
+
+pandas is only imported by the functions that read or seal partitions, so
+recording an event stays cheap.
+"""
+import csv
+import os
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking, single process only
+    fcntl = None
+
+from medcore.storage import shard_dir
+
+HISTORY_DIR = "history"
+COLUMNS = ["ts", "record_id", "medicine", "status", "previous", "source"]
+
+_sealed_through = {}
+
+
+def _month(moment):
+    return moment.strftime("%Y-%m")
+
+
+def _months_between(start, end):
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        yield f"{year:04d}-{month:02d}"
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def _sealed_format():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return ".csv.gz"
+    return ".parquet"
+
+
+def user_root(user):
+    if user is None:
+        return HISTORY_DIR
+    return os.path.join(shard_dir(user), HISTORY_DIR)
+
+
+def partition_paths(month, root=HISTORY_DIR):
+    return [os.path.join(root, month + suffix) for suffix in (".parquet", ".csv.gz", ".csv")]
+
+
+@contextmanager
+def _partition_lock(root, month):
+    # The app and the reminder service may both seal a month, or append to
+    # it while it is sealed; both hold this flock on YYYY-MM.lock.
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(root, month + ".lock"), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+
+def record_event(record_id, medicine, status, previous=None, source="quick", when=None, root=HISTORY_DIR):
+    when = when or datetime.now(timezone.utc)
+    month = _month(when)
+    if _sealed_through.get(root) != month:
+        seal_partitions(root, before=month)
+        _sealed_through[root] = month
+    os.makedirs(root, exist_ok=True)
+    path = os.path.join(root, month + ".csv")
+    with _partition_lock(root, month):
+        new_file = not os.path.exists(path)
+        with open(path, "a", newline="") as f:
+            writer = csv.writer(f)
+            if new_file:
+                writer.writerow(COLUMNS)
+            writer.writerow([when.isoformat(), record_id, medicine, status, previous or "", source])
+
+
+def _read_partition(path):
+    import pandas as pd
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path)
+    return pd.read_csv(path, dtype=str, keep_default_na=False)
+
+
+def seal_partitions(root=HISTORY_DIR, before=None):
+    """Convert finished months' CSV partitions to compressed columnar files."""
+    before = before or _month(datetime.now(timezone.utc))
+    if not os.path.isdir(root):
+        return []
+    sealed = []
+    suffix = _sealed_format()
+    for name in sorted(os.listdir(root)):
+        if not name.endswith(".csv") or name[:-4] >= before:
+            continue
+        import pandas as pd
+        hot = os.path.join(root, name)
+        target = os.path.join(root, name[:-4] + suffix)
+        with _partition_lock(root, name[:-4]):
+            try:
+                frame = _read_partition(hot)
+            except FileNotFoundError:
+                # Another process sealed it first.
+                continue
+            if os.path.exists(target):
+                # Late events for an already sealed month are folded back in.
+                frame = pd.concat([_read_partition(target).astype(str), frame], ignore_index=True)
+            for column in ["record_id", "medicine", "status", "previous", "source"]:
+                frame[column] = frame[column].astype("category")
+            fd, tmp = tempfile.mkstemp(prefix="." + os.path.basename(target) + ".", suffix=".tmp", dir=root)
+            os.close(fd)
+            try:
+                if suffix == ".parquet":
+                    frame.to_parquet(tmp, index=False, compression="zstd")
+                else:
+                    frame.to_csv(tmp, index=False, compression="gzip")
+                os.replace(tmp, target)
+            except BaseException:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                raise
+            try:
+                os.remove(hot)
+            except FileNotFoundError:
+                pass
+        sealed.append(target)
+    return sealed
+
+
+def has_history(root=HISTORY_DIR):
+    return os.path.isdir(root) and any(name.endswith((".csv", ".csv.gz", ".parquet")) for name in os.listdir(root))
+
+
+def _month_events(month, start, end, root):
+    import pandas as pd
+    frames = [_read_partition(path) for path in partition_paths(month, root) if os.path.exists(path)]
+    if not frames:
+        return None
+    frame = pd.concat(frames, ignore_index=True)
+    frame["ts"] = pd.to_datetime(frame["ts"], utc=True, format="ISO8601")
+    return frame[(frame["ts"] >= start) & (frame["ts"] <= end)]
+
+
+def read_history(start, end=None, medicine=None, record_id=None, root=HISTORY_DIR):
+    """Events with start <= ts <= end (aware datetimes), oldest first."""
+    import pandas as pd
+    end = end or datetime.now(timezone.utc)
+    frames = [frame for month in _months_between(start.astimezone(timezone.utc), end.astimezone(timezone.utc))
+              if (frame := _month_events(month, start, end, root)) is not None]
+    if not frames:
+        return pd.DataFrame(columns=COLUMNS)
+    frame = pd.concat(frames, ignore_index=True)
+    mask = pd.Series(True, index=frame.index)
+    if medicine is not None:
+        mask &= frame["medicine"] == medicine
+    if record_id is not None:
+        mask &= frame["record_id"] == record_id
+    return frame[mask].sort_values("ts", kind="stable").reset_index(drop=True)
+
+
+def iter_history(start, end=None, root=HISTORY_DIR):
+    """Like read_history, but yields event dicts one month at a time."""
+    end = end or datetime.now(timezone.utc)
+    for month in _months_between(start.astimezone(timezone.utc), end.astimezone(timezone.utc)):
+        frame = _month_events(month, start, end, root)
+        if frame is None:
+            continue
+        frame = frame.sort_values("ts", kind="stable").astype({column: str for column in COLUMNS[1:]})
+        for row in frame[COLUMNS].itertuples(index=False, name=None):
+            yield dict(zip(COLUMNS, (row[0].isoformat(), *row[1:])))
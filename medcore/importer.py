@@ -0,0 +1,144 @@
+"""Bulk import of Quick Add entries from CSV, NDJSON or a JSON list.
+
+Rows are read one at a time from the file object, checked against the
+catalog and written with store.add_many in batches, so memory stays bounded
+by the batch size whatever the size of the file (a JSON list is parsed
+whole, as json has no incremental reader). Columns (CSV header, NDJSON or
+JSON keys):
+
+    medicine, time (HH:MM), country    required
+    timezone, state                    default to the country's first
+    disease                            defaults to a condition listing the medicine
+    notes, status                      default to "" and "Due"
+    rule                               optional recurrence rule (JSON, see recurrence.py)
+
+Rows that fail a check are skipped and reported with their row number; the
+first MAX_ERRORS are kept, later ones are only counted.
+"""
+import csv
+import io
+import json
+
+from medcore.catalog import load_catalog
+from medcore.recurrence import TIME_PATTERN, validate_rule
+
+FORMATS = {".csv": "csv", ".ndjson": "ndjson", ".jsonl": "ndjson", ".json": "json"}
+STATUSES = ["Due", "Taken", "Missed"]
+BATCH_SIZE = 500
+MAX_ERRORS = 200
+
+
+def detect_format(filename):
+    for extension, fmt in FORMATS.items():
+        if filename.lower().endswith(extension):
+            return fmt
+    raise ValueError(f"{filename}: expected a .csv, .ndjson, .jsonl or .json file")
+
+
+def iter_rows(f, fmt):
+    """Yield (row number, dict) from a text or binary file object."""
+    if not isinstance(f, io.TextIOBase):
+        f = io.TextIOWrapper(f, encoding="utf-8-sig", newline="")
+    if fmt == "csv":
+        for number, row in enumerate(csv.DictReader(f), start=2):
+            yield number, row
+        return
+    if fmt == "json":
+        rows = json.load(f)
+        if not isinstance(rows, list):
+            raise ValueError("expected a JSON list of entries")
+        for number, row in enumerate(rows, start=1):
+            yield number, row if isinstance(row, dict) else None
+        return
+    for number, line in enumerate(f, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield number, row if isinstance(row, dict) else None
+
+
+class RowValidator:
+    def __init__(self, catalog=None):
+        self.catalog = catalog or load_catalog()
+        self._medicines = {}
+
+    def _country_medicines(self, country):
+        # {lowercased medicine: (medicine, first condition listing it)}
+        medicines = self._medicines.get(country)
+        if medicines is None:
+            medicines = self._medicines[country] = {}
+            for condition, names in self.catalog.conditions[country].items():
+                for name in names:
+                    medicines.setdefault(name.lower(), (name, condition))
+        return medicines
+
+    def validate(self, row):
+        """(entry, None) for a valid row, (None, message) otherwise."""
+        if row is None:
+            return None, "not a JSON object"
+        value = lambda field: str(row.get(field) or "").strip()
+        country = value("country")
+        if country not in self.catalog.countries:
+            return None, f"unknown country {country!r}" if country else "missing country"
+        info = self.catalog.countries[country]
+        timezone = value("timezone") or info["timezones"][0]
+        if timezone not in info["timezones"]:
+            return None, f"timezone {timezone!r} is not used in {country}"
+        state = value("state") or info["states"][0]
+        if state not in info["states"]:
+            return None, f"unknown state {state!r} for {country}"
+        match = TIME_PATTERN.match(value("time"))
+        if match is None:
+            return None, f"time {value('time')!r} is not HH:MM"
+        medicine = value("medicine")
+        known = self._country_medicines(country).get(medicine.lower())
+        if known is None:
+            return None, f"{medicine!r} is not in the {country} catalog" if medicine else "missing medicine"
+        medicine, disease = known
+        if value("disease"):
+            disease = value("disease")
+            if medicine not in self.catalog.conditions[country].get(disease, ()):
+                return None, f"{medicine} is not listed for {disease!r} in {country}"
+        status = value("status") or "Due"
+        if status not in STATUSES:
+            return None, f"unknown status {status!r}"
+        entry = {"country": country, "state": state, "timezone": timezone, "disease": disease,
+                 "medicine": medicine, "time": f"{int(match.group(1)):02d}:{match.group(2)}",
+                 "notes": value("notes"), "status": status}
+        rule = row.get("rule")
+        if rule:
+            try:
+                entry["rule"] = validate_rule(json.loads(rule) if isinstance(rule, str) else rule)
+            except ValueError as e:
+                return None, f"bad rule: {e}"
+        return entry, None
+
+
+def import_rows(store, f, fmt, batch_size=BATCH_SIZE, catalog=None):
+    """Validate and add every row of f; returns a report dict:
+
+        {"rows": 1200, "imported": 1190, "errors": [(row, message), ...], "error_count": 10}
+    """
+    validator = RowValidator(catalog)
+    report = {"rows": 0, "imported": 0, "errors": [], "error_count": 0}
+    batch = []
+    for number, row in iter_rows(f, fmt):
+        report["rows"] += 1
+        entry, error = validator.validate(row)
+        if error:
+            report["error_count"] += 1
+            if len(report["errors"]) < MAX_ERRORS:
+                report["errors"].append((number, error))
+            continue
+        batch.append(entry)
+        if len(batch) >= batch_size:
+            store.add_many(batch)
+            report["imported"] += len(batch)
+            batch = []
+    if batch:
+        store.add_many(batch)
+        report["imported"] += len(batch)
+    return report
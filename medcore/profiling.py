@@ -0,0 +1,85 @@
+"""Per-section wall time for one script run.
+
+The app calls profiler.mark("name") where each section starts; time until
+the next mark is charged to that section, so sections need no extra
+indentation. Given an elements() callable returning how many elements the
+run has drawn so far, each mark also charges the elements drawn since the
+previous one. A disabled profiler does nothing.
+
+Finished runs can be appended to a JSON-lines trace file, and
+
+    python -m medcore.profiling trace.jsonl
+
+prints the median, 95th percentile and maximum of every section.
+"""
+import json
+import sys
+import time
+from datetime import datetime, timezone
+
+
+class Profiler:
+    def __init__(self, enabled=True, elements=None):
+        self.enabled = enabled
+        self.elements = elements
+        self.sections = {}
+        self._current = None
+        self._started = self._lap = time.perf_counter()
+        self._drawn = elements() if enabled and elements else 0
+
+    def _close(self, now):
+        drawn = self.elements() if self.elements else 0
+        if self._current is not None:
+            self.sections[self._current][0] += now - self._lap
+            self.sections[self._current][1] += drawn - self._drawn
+        self._lap = now
+        self._drawn = drawn
+
+    def mark(self, name):
+        if not self.enabled:
+            return
+        self._close(time.perf_counter())
+        self._current = name
+        self.sections.setdefault(name, [0.0, 0])
+
+    def finish(self, **fields):
+        now = time.perf_counter()
+        self._close(now)
+        self._current = None
+        return dict(fields, ts=datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                    total_ms=round((now - self._started) * 1000, 2),
+                    sections={name: {"ms": round(seconds * 1000, 2), "elements": elements}
+                              for name, (seconds, elements) in self.sections.items()})
+
+
+def write_trace(path, record):
+    with open(path, "a") as f:
+        f.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+
+def summarize(path):
+    """{section: {"runs", "p50_ms", "p95_ms", "max_ms"}} over a trace file."""
+    timings = {}
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            timings.setdefault("total", []).append(record["total_ms"])
+            for name, section in record["sections"].items():
+                timings.setdefault(name, []).append(section["ms"])
+    summary = {}
+    for name, values in timings.items():
+        values.sort()
+        summary[name] = {"runs": len(values), "p50_ms": values[len(values) // 2],
+                         "p95_ms": values[min(len(values) - 1, int(len(values) * 0.95))], "max_ms": values[-1]}
+    return summary
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        sys.exit("usage: python -m medcore.profiling TRACE.jsonl")
+    print(f"{'section':<20} {'runs':>6} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}")
+    for name, row in sorted(summarize(sys.argv[1]).items(), key=lambda item: -item[1]["p95_ms"]):
+        print(f"{name:<20} {row['runs']:>6} {row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} {row['max_ms']:>9.2f}")
@@ -0,0 +1,229 @@
+"""Recurring dose rules.
+
+An entry without a rule is taken once a day at its "time". A rule is a
+plain dict saved with the entry (JSON, or a JSON column in SQLite):
+
+    {"times": ["08:00", "14:00", "20:00"]}     at these times every day
+    {"every_hours": 8, "from": "06:00"}        every 8 hours, counted from
+                                               "from" on the start date
+    "weekdays": [0, 2, 4]                      only Mon, Wed and Fri
+    "start": "2026-01-05", "end": "2026-03-31" first and last day (inclusive)
+    "taper": [{"days": 5, "times": [...]},     a course: each step is a
+              {"days": 5, "every_hours": 12}]  pattern for its number of
+                                               days, after which it ends
+
+Occurrences are generated day by day from the rule for whatever window is
+asked for, so a year of a six-times-a-day rule is never built as a list.
+Dates and times are local to the entry's timezone.
+"""
+import itertools
+import math
+import re
+from datetime import date, datetime, timedelta
+
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+EVERY_HOURS = [4, 6, 8, 12]
+EPOCH = date(2000, 1, 1)
+MINUTES_PER_DAY = 24 * 60
+TIME_PATTERN = re.compile(r"^([01]?\d|2[0-3]):([0-5]\d)$")
+
+
+def _minutes(time_str):
+    hour, minute = time_str.split(":")
+    return int(hour) * 60 + int(minute)
+
+
+def _time_str(minutes):
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def spread_times(first, count, span_hours=12):
+    """count times a day, evenly over span_hours from first (2 -> 08:00, 20:00)."""
+    if count <= 1:
+        return [first]
+    step = span_hours * 60 // (count - 1)
+    return sorted({_time_str((_minutes(first) + i * step) % MINUTES_PER_DAY) for i in range(count)})
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _check_time(value):
+    if not isinstance(value, str) or not TIME_PATTERN.match(value):
+        raise ValueError(f"bad time {value!r}, expected HH:MM")
+
+
+def _check_pattern(pattern):
+    if not isinstance(pattern, dict):
+        raise ValueError("every taper step must be a JSON object")
+    if "every_hours" in pattern:
+        hours = pattern["every_hours"]
+        if not _is_int(hours) or not 1 <= hours <= 48:
+            raise ValueError("every_hours must be a whole number of hours from 1 to 48")
+        _check_time(pattern.get("from", "00:00"))
+    elif pattern.get("times"):
+        if not isinstance(pattern["times"], list):
+            raise ValueError("times must be a list of HH:MM times")
+        for time_str in pattern["times"]:
+            _check_time(time_str)
+    else:
+        raise ValueError("a rule needs times or every_hours")
+
+
+def _has_dose(rule, first_day, days):
+    return any(day_times(rule, first_day + timedelta(days=offset)) for offset in range(days))
+
+
+def validate_rule(rule):
+    """Raise ValueError unless rule is a usable rule dict with at least one dose."""
+    if not isinstance(rule, dict):
+        raise ValueError("a rule must be a JSON object")
+    taper = rule.get("taper")
+    if taper is not None and (not isinstance(taper, list) or not taper):
+        raise ValueError("taper must be a list of steps")
+    for step in taper or [rule]:
+        _check_pattern(step)
+        if taper and (not _is_int(step.get("days")) or step["days"] < 1):
+            raise ValueError("every taper step needs a number of days")
+    if taper and not rule.get("start"):
+        raise ValueError("a tapering course needs a start date")
+    if "weekdays" in rule:
+        weekdays = rule["weekdays"]
+        if not isinstance(weekdays, list) or not all(_is_int(day) and 0 <= day <= 6 for day in weekdays):
+            raise ValueError("weekdays must be a list of days from 0 (Monday) to 6")
+        if not weekdays:
+            raise ValueError("a rule needs at least one weekday")
+    for key in ("start", "end"):
+        if rule.get(key) and not isinstance(rule[key], str):
+            raise ValueError(f"{key} must be a YYYY-MM-DD date")
+    try:
+        first, last = rule_dates(rule)
+        if first and last and last < first:
+            raise ValueError("the rule ends before it starts")
+        period = rule_period(rule)
+        if taper:
+            # Every step's pattern repeats within the period, so a step
+            # without a dose in its first period never has one.
+            step_start = first
+            for number, step in enumerate(taper, start=1):
+                if not _has_dose(rule, step_start, min(step["days"], period)):
+                    raise ValueError(f"taper step {number} never has a dose")
+                step_start += timedelta(days=step["days"])
+        else:
+            begin = first or (last - timedelta(days=period) if last else date.today())
+            if next(occurrences(rule, begin, horizon(rule, begin)), None) is None:
+                raise ValueError("the rule never has a dose")
+    except OverflowError:
+        raise ValueError("the rule runs past the year 9999")
+    return rule
+
+
+def rule_dates(rule):
+    """(first day, last day) of a rule; either may be None (open-ended)."""
+    first = date.fromisoformat(rule["start"]) if rule.get("start") else None
+    last = date.fromisoformat(rule["end"]) if rule.get("end") else None
+    if rule.get("taper"):
+        course_end = first + timedelta(days=sum(step["days"] for step in rule["taper"]) - 1)
+        last = min(last, course_end) if last else course_end
+    return first, last
+
+
+def rule_period(rule):
+    """Days after which the daily doses of a rule (or of each taper step)
+    repeat: 1 for fixed times, 7 with weekdays, longer for every_hours
+    steps that do not divide a day (every 42 h repeats after 7 days)."""
+    period = 7 if "weekdays" in rule else 1
+    for pattern in rule.get("taper") or [rule]:
+        if "every_hours" in pattern:
+            step = pattern["every_hours"] * 60
+            cycle = step // math.gcd(step, MINUTES_PER_DAY)
+            period = period * cycle // math.gcd(period, cycle)
+    return period
+
+
+def horizon(rule, start):
+    """The last day worth searching from start for a rule's next dose.
+
+    One period past the later of start and the first day covers every
+    dose pattern an open-ended rule has; a tapering course ends by itself.
+    """
+    first, last = rule_dates(rule)
+    if rule.get("taper"):
+        return last
+    end = max(start, first or start) + timedelta(days=rule_period(rule))
+    return min(end, last) if last else end
+
+
+def _pattern_on(rule, day, first):
+    # The pattern in force on day, and the day it started from.
+    if not rule.get("taper"):
+        return rule, first or EPOCH
+    step_start = first
+    for step in rule["taper"]:
+        if day < step_start + timedelta(days=step["days"]):
+            return step, step_start
+        step_start += timedelta(days=step["days"])
+    return None, None
+
+
+def day_times(rule, day):
+    """Sorted "HH:MM" dose times of rule on day ([] if none that day)."""
+    first, last = rule_dates(rule)
+    if (first and day < first) or (last and day > last):
+        return []
+    if "weekdays" in rule and day.weekday() not in rule["weekdays"]:
+        return []
+    pattern, since = _pattern_on(rule, day, first)
+    if pattern is None:
+        return []
+    if "every_hours" not in pattern:
+        return sorted({_time_str(_minutes(time_str)) for time_str in pattern["times"]})
+    step = pattern["every_hours"] * 60
+    anchor = datetime.combine(since, datetime.min.time()) + timedelta(minutes=_minutes(pattern.get("from", "00:00")))
+    day_start = datetime.combine(day, datetime.min.time())
+    offset = (day_start - anchor) // timedelta(minutes=1)
+    minute = max(0, -(-offset // step) * step) - offset
+    return [_time_str(m) for m in range(minute, MINUTES_PER_DAY, step)]
+
+
+def occurrences(rule, start, end=None):
+    """Lazily yield (date, "HH:MM") for every dose of rule from start to end
+    (inclusive dates; end=None runs until the rule ends, or forever)."""
+    first, last = rule_dates(rule)
+    day = max(start, first) if first else start
+    if last and (end is None or last < end):
+        end = last
+    days = itertools.count() if end is None else range((end - day).days + 1)
+    for offset in days:
+        current = day + timedelta(days=offset)
+        for time_str in day_times(rule, current):
+            yield current, time_str
+
+
+def current_time(rule, now, window_minutes=30):
+    """The dose time of today to show now: the first not more than
+    window_minutes past, else the day's last; None if no dose today."""
+    times = day_times(rule, now.date())
+    if not times:
+        return None
+    earliest = now.hour * 60 + now.minute - window_minutes
+    return next((time_str for time_str in times if _minutes(time_str) >= earliest), times[-1])
+
+
+def describe(rule):
+    """Short text for a rule, e.g. "3x daily · Mon, Wed, Fri · until 2026-03-31"."""
+    if rule.get("taper"):
+        parts = [f"tapering over {sum(step['days'] for step in rule['taper'])} days"]
+    elif "every_hours" in rule:
+        parts = [f"every {rule['every_hours']} h from {rule.get('from', '00:00')}"]
+    else:
+        parts = [f"{len(rule['times'])}x daily ({', '.join(sorted(rule['times']))})"]
+    if "weekdays" in rule and len(set(rule["weekdays"])) < 7:
+        parts.append(", ".join(WEEKDAYS[day] for day in sorted(set(rule["weekdays"]))))
+    first, _ = rule_dates(rule)
+    if first and first > date.today():
+        parts.append(f"from {first.isoformat()}")
+    if rule.get("end"):
+        parts.append(f"until {rule['end']}")
+    return " · ".join(parts)
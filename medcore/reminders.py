@@ -0,0 +1,242 @@
+"""Background reminder service for Quick Add doses.
+
+Runs outside Streamlit and shares the same stores as medtimer.py:
+
+    python -m medcore.reminders --log reminders.log
+
+One service covers every user shard under users/ (or a single profile with
+--user). For every dose it keeps three timers in one heap across all
+shards: the due window opening (the dose goes back to "Due" for the day, unless it
+was marked after the previous dose's window closed),
+the dose time itself (a reminder is sent) and the window closing (a dose
+still "Due" is marked "Missed"). The loop sleeps until the earliest timer
+or the next poll for storage changes, whichever comes first. A poll reads
+only users/changes.log, where every store write names its shard, so an idle
+service does one stat between timers no matter how many shards it holds.
+A shard that changed is reloaded on its own; its old timers are dropped
+lazily as they reach the top of the heap.
+"""
+import argparse
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+
+from medcore.history import HISTORY_DIR, read_history, record_event
+from medcore.schedule import DUE_WINDOW_MINUTES, next_fire, previous_fire
+from medcore.storage import SHARD_ROOT, changed_shards, open_shard, shard_dir, shard_folders, split_legacy_store
+
+log = logging.getLogger("medcore.reminders")
+
+OPEN, REMIND, CLOSE = "open", "remind", "close"
+
+
+class LogSink:
+    """Appends one JSON line per notification to a local file."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def send(self, notification):
+        with open(self.path, "a") as f:
+            f.write(json.dumps(notification) + "\n")
+
+
+class LoggingSink:
+    def send(self, notification):
+        log.info("%s: %s at %s", notification["kind"], notification["medicine"], notification["time"])
+
+
+class ReminderService:
+    def __init__(self, root=SHARD_ROOT, user=None, backend=None, sinks=None, poll_seconds=5.0,
+                 window_minutes=DUE_WINDOW_MINUTES, clock=None):
+        # Every shard under root, or only the given user's.
+        self.root = root
+        self.only = shard_dir(user, root) if user is not None else None
+        self.backend = backend
+        self.sinks = list(sinks) if sinks is not None else [LoggingSink()]
+        self.poll_seconds = poll_seconds
+        self.window = timedelta(minutes=window_minutes)
+        self.clock = clock or (lambda: datetime.now(timezone.utc))
+        self.heap = []
+        # Per shard key: its store, history root, entries by id, the store
+        # revision they were read at, and the generation of its timers.
+        self.shard_store = {}
+        self.history_roots = {}
+        self.entries = {}
+        self.revisions = {}
+        self.generations = {}
+        # Position in the root's changes file, and shards whose timers
+        # conflicted with another writer and must be reread.
+        self.position = None
+        self.stale = set()
+        self._seq = itertools.count()
+
+    def _push(self, kind, key, entry, after):
+        fire = next_fire(entry["time"], entry.get("timezone"), after + self._offset(kind), entry.get("rule"))
+        if fire is None:
+            return
+        heapq.heappush(self.heap, (fire - self._offset(kind), next(self._seq), kind, key, self.generations[key],
+                                   entry["id"], entry["time"], entry.get("timezone")))
+
+    def _offset(self, kind):
+        # Timers are stored at their own instant; the offset maps it back to
+        # the dose time so next_fire() can do the timezone work.
+        if kind == OPEN:
+            return self.window
+        if kind == CLOSE:
+            return -self.window
+        return timedelta(0)
+
+    def rebuild(self, key, store, now):
+        self.entries[key] = {entry["id"]: entry for entry in store.entries()}
+        self.generations[key] = next(self._seq)
+        for entry in self.entries[key].values():
+            for kind in (OPEN, REMIND, CLOSE):
+                self._push(kind, key, entry, now)
+        self.revisions[key] = store.revision()
+
+    def drop(self, key):
+        for by_key in (self.shard_store, self.history_roots, self.entries, self.revisions, self.generations):
+            by_key.pop(key, None)
+
+    def _prune(self):
+        # Rebuilt shards leave their old timers behind; once they make up
+        # most of the heap, filter them out in one pass.
+        live = 3 * sum(len(entries) for entries in self.entries.values())
+        if len(self.heap) > 2 * live + 1024:
+            self.heap = [item for item in self.heap if self.generations.get(item[3]) == item[4]]
+            heapq.heapify(self.heap)
+
+    def notify(self, kind, entry, when):
+        notification = {"kind": kind, "id": entry["id"], "medicine": entry.get("medicine"),
+                        "time": entry["time"], "timezone": entry.get("timezone"), "at": when.isoformat()}
+        for sink in self.sinks:
+            try:
+                sink.send(notification)
+            except Exception:
+                log.exception("reminder sink %r failed", sink)
+
+    def marked_for_this_dose(self, key, entry, opens):
+        """Whether entry's status was set in the app (or the CLI) after the
+        previous dose's window closed, i.e. for the dose opening now, such
+        as a dose taken a little early."""
+        previous = previous_fire(entry["time"], entry.get("timezone"), opens + self.window, entry.get("rule"))
+        if previous is None:
+            return True
+        events = read_history(previous + self.window, self.clock(), record_id=entry["id"],
+                              root=self.history_roots[key])
+        return bool((events["source"] != "daemon").any())
+
+    def fire_due(self, now):
+        """Handle every timer at or before now; returns the number handled."""
+        handled = 0
+        written, stale = set(), set()
+        while self.heap and self.heap[0][0] <= now:
+            when, _, kind, key, generation, record_id, time_str, tz_name = heapq.heappop(self.heap)
+            if self.generations.get(key) != generation:
+                # The shard was reloaded (or is gone) since the timer was pushed.
+                continue
+            entry = self.entries[key].get(record_id)
+            if entry is None or entry["time"] != time_str or entry.get("timezone") != tz_name:
+                # Deleted or rescheduled since the timer was pushed.
+                continue
+            store, history_root = self.shard_store[key], self.history_roots[key]
+            if kind == OPEN and entry.get("status") != "Due" and not self.marked_for_this_dose(key, entry, when):
+                # On the JSON backend entry is the store's own dict, which
+                # the update below already changes.
+                previous = entry.get("status")
+                if store.update(record_id, expect={"status": previous}, status="Due"):
+                    stale.add(key)
+                    continue
+                record_event(record_id, entry.get("medicine"), "Due", previous=previous, source="daemon",
+                             root=history_root)
+                entry["status"] = "Due"
+                written.add(key)
+            elif kind == REMIND and entry.get("status") == "Due":
+                self.notify("due", entry, when)
+            elif kind == CLOSE and entry.get("status") == "Due":
+                if store.update(record_id, expect={"status": "Due"}, status="Missed"):
+                    # Taken (or deleted) in the app meanwhile: resync and leave it be.
+                    stale.add(key)
+                    continue
+                record_event(record_id, entry.get("medicine"), "Missed", previous="Due", source="daemon",
+                             root=history_root)
+                entry["status"] = "Missed"
+                written.add(key)
+                self.notify("missed", entry, when)
+            self._push(kind, key, entry, when + timedelta(seconds=1))
+            handled += 1
+        for key in stale:
+            self.revisions[key] = None
+        self.stale |= stale
+        for key in written - stale:
+            # Our own writes should not trigger a rebuild.
+            self.revisions[key] = self.shard_store[key].revision()
+        return handled
+
+    def seconds_until_next(self, now):
+        if not self.heap:
+            return self.poll_seconds
+        return max(0.0, min(self.poll_seconds, (self.heap[0][0] - now).total_seconds()))
+
+    def sync(self, key, now):
+        if not os.path.isdir(key):
+            self.drop(key)
+            return
+        # Reopened so the JSON backend catches up with other processes.
+        store = self.shard_store[key] = open_shard(key, self.backend)
+        self.history_roots[key] = os.path.join(key, HISTORY_DIR)
+        if store.revision() != self.revisions.get(key):
+            self.rebuild(key, store, now)
+
+    def step(self):
+        now = self.clock()
+        self.position, changed = changed_shards(self.root, self.position)
+        if changed is None:
+            keys = [self.only] if self.only is not None else shard_folders(self.root)
+            for key in set(self.entries) - set(keys):
+                self.drop(key)
+        else:
+            keys = [key for key in changed if self.only is None or key == self.only]
+        for key in set(keys) | self.stale:
+            self.sync(key, now)
+        self.stale.clear()
+        self._prune()
+        self.fire_due(now)
+        return self.seconds_until_next(self.clock())
+
+    async def run(self, stop=None):
+        stop = stop or asyncio.Event()
+        while not stop.is_set():
+            delay = self.step()
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Send MedTimer dose reminders and mark missed doses.")
+    parser.add_argument("--log", help="append notifications as JSON lines to this file")
+    parser.add_argument("--root", default=SHARD_ROOT, help="directory holding the per-user shards")
+    parser.add_argument("--user", help="serve only this profile's shard (default: every shard under --root)")
+    parser.add_argument("--poll", type=float, default=5.0, help="seconds between checks for storage changes")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    sinks = [LoggingSink()]
+    if args.log:
+        sinks.append(LogSink(args.log))
+    split_legacy_store(root=args.root)
+    try:
+        service = ReminderService(root=args.root, user=args.user, sinks=sinks, poll_seconds=args.poll)
+        asyncio.run(service.run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+"""Dose status classification for the dashboard and the Quick Add list."""
+import bisect
+import heapq
+import itertools
+import threading
+from array import array
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from medcore.recurrence import current_time, horizon, occurrences, rule_period
+
+DUE_WINDOW_MINUTES = 30
+MINUTES_PER_DAY = 24 * 60
+
+CARD_STYLES = {
+    "taken": ("med-card-taken", "🟩 Taken"),
+    "missed": ("med-card-missed", "🟥 Missed"),
+    "due": ("med-card-due", "🔴 Due Now"),
+    "upcoming": ("med-card", "⏰ Upcoming"),
+    "scheduled": ("med-card", "⏰ Scheduled"),
+    "off": ("med-card", "💤 Not Today"),
+}
+
+
+def minutes_of_day(moment):
+    return moment.hour * 60 + moment.minute
+
+
+def time_to_minutes(time_str):
+    hour, minute = time_str.split(":")
+    return int(hour) * 60 + int(minute)
+
+
+class ScheduleIndex:
+    """Dose times of a store's entries, kept in time order.
+
+    minutes is an array('H') of minutes since midnight in ascending order
+    and ids holds the record id at the same position, so time ranges are two
+    binary searches and a slice; entries with the same time are ordered by
+    id, so every process pages through them identically. Windows are inclusive and wrap past midnight when
+    start > end (22:00-02:00), in which case results run from start onwards.
+    """
+
+    def __init__(self, items=()):
+        pairs = sorted((time_to_minutes(time_str), record_id) for record_id, time_str in items)
+        self.minutes = array("H", [minute for minute, _ in pairs])
+        self.ids = [record_id for _, record_id in pairs]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def clear(self):
+        del self.minutes[:]
+        del self.ids[:]
+
+    def __iter__(self):
+        return zip(self.minutes, self.ids)
+
+    def _position(self, minute, record_id):
+        lo = bisect.bisect_left(self.minutes, minute)
+        hi = bisect.bisect_right(self.minutes, minute, lo)
+        return bisect.bisect_left(self.ids, record_id, lo, hi)
+
+    def add(self, record_id, time_str):
+        minute = time_to_minutes(time_str)
+        i = self._position(minute, record_id)
+        self.minutes.insert(i, minute)
+        self.ids.insert(i, record_id)
+
+    def remove(self, record_id, time_str):
+        minute = time_to_minutes(time_str)
+        i = self._position(minute, record_id)
+        if i < len(self.ids) and self.ids[i] == record_id:
+            del self.minutes[i]
+            del self.ids[i]
+
+    def _spans(self, start, end):
+        if start is None:
+            return [(0, len(self.ids))]
+        lo = bisect.bisect_left(self.minutes, start)
+        if start <= end:
+            return [(lo, bisect.bisect_right(self.minutes, end, lo))]
+        return [(lo, len(self.ids)), (0, bisect.bisect_right(self.minutes, end, 0, lo))]
+
+    def select(self, start=None, end=None, offset=0, limit=None):
+        """Ids with start <= time <= end (minutes since midnight), paged."""
+        found = []
+        for lo, hi in self._spans(start, end):
+            lo += offset
+            offset = max(0, lo - hi)
+            if lo >= hi:
+                continue
+            if limit is not None:
+                hi = min(hi, lo + limit - len(found))
+            found.extend(self.ids[lo:hi])
+            if limit is not None and len(found) >= limit:
+                break
+        return found
+
+    def count(self, start=None, end=None):
+        return sum(hi - lo for lo, hi in self._spans(start, end))
+
+
+def get_zone(tz_name):
+    # Unknown or missing zones fall back to the server's local time.
+    if not tz_name:
+        return None
+    try:
+        return ZoneInfo(tz_name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return None
+
+
+def local_now(tz_name, now=None):
+    now = now or datetime.now(timezone.utc)
+    if now.tzinfo is None:
+        now = now.astimezone()
+    return now.astimezone(get_zone(tz_name))
+
+
+def classify_schedule(entries, now=None, mode="guided", tz=None):
+    """Classify every entry's "HH:MM" time against now in one vectorized pass.
+
+    "Now" is taken in each entry's own "timezone" (or ``tz`` when the entry
+    has none), so a dose at 08:00 Asia/Tokyo is compared with the time in
+    Tokyo rather than on the server.
+
+    Returns a DataFrame whose index is the entry's position in ``entries``,
+    with columns ``minutes`` (minutes since midnight) and ``time_state``.
+    Guided rows are sorted by time; quick rows keep the order of ``entries``,
+    a page the store already returns in schedule order (evening doses first
+    for a window past midnight).
+
+    - mode="guided": "missed" once the time has passed, "due" within the next
+      DUE_WINDOW_MINUTES, otherwise "upcoming".
+    - mode="quick": "due" within DUE_WINDOW_MINUTES either side of now
+      (wrapping around midnight), otherwise "scheduled".
+
+    An entry with a recurrence rule is classified by today's dose closest
+    to now (see recurrence.current_time), or "off" on days without one.
+
+    The stored status (taken, missed, ...) still wins over time_state; see
+    dose_state().
+    """
+    import numpy as np
+    import pandas as pd
+    shown = [entry["time"] if not entry.get("rule") else
+             current_time(entry["rule"], local_now(entry.get("timezone") or tz, now), DUE_WINDOW_MINUTES)
+             for entry in entries]
+    off = np.array([time_str is None for time_str in shown], dtype=bool)
+    times = pd.Series([time_str or entry["time"] for time_str, entry in zip(shown, entries)], dtype="object")
+    if times.empty:
+        return pd.DataFrame({"minutes": pd.Series(dtype="int64"), "time_state": pd.Series(dtype="object")})
+    zones = pd.Series([entry.get("timezone") or tz or "" for entry in entries], dtype="object")
+    now_minutes = zones.map({name: minutes_of_day(local_now(name, now)) for name in zones.unique()})
+    parts = times.str.split(":", n=1, expand=True).astype("int64")
+    minutes = parts[0] * 60 + parts[1]
+    delta = minutes - now_minutes
+    if mode == "guided":
+        time_state = np.select([delta < 0, delta <= DUE_WINDOW_MINUTES], ["missed", "due"], "upcoming")
+    else:
+        distance = delta.abs()
+        distance = np.minimum(distance, MINUTES_PER_DAY - distance)
+        time_state = np.where(distance <= DUE_WINDOW_MINUTES, "due", "scheduled")
+    time_state = np.where(off, "off", time_state)
+    frame = pd.DataFrame({"minutes": minutes, "time_state": time_state})
+    if mode == "guided":
+        frame = frame.sort_values("minutes", kind="stable")
+    return frame
+
+
+def dose_state(stored_status, time_state):
+    # Quick Add stores "Taken"/"Missed"/"Due"; the guided flow stores "taken"
+    # in med_status or nothing at all.
+    if stored_status is None or stored_status == "Due":
+        return time_state
+    return stored_status.lower()
+
+
+def next_fire(time_str, tz_name, after, rule=None):
+    """First aware instant at or after ``after`` whose local time is time_str.
+
+    With a recurrence rule, the first of the rule's doses instead, or None
+    once the rule has ended (or if it has no dose within one repeat of its
+    pattern, see recurrence.horizon).
+    """
+    zone = get_zone(tz_name)
+    local = after.astimezone(zone)
+    if rule:
+        for day, time_str in occurrences(rule, local.date(), horizon(rule, local.date())):
+            hour, minute = (int(part) for part in time_str.split(":"))
+            candidate = datetime(day.year, day.month, day.day, hour, minute, tzinfo=zone)
+            if zone is None:
+                candidate = candidate.astimezone()
+            if candidate >= after:
+                return candidate.astimezone(timezone.utc)
+        return None
+    hour, minute = (int(part) for part in time_str.split(":"))
+    day = local.date()
+    while True:
+        candidate = datetime(day.year, day.month, day.day, hour, minute, tzinfo=zone)
+        if zone is None:
+            candidate = candidate.astimezone()
+        if candidate >= after:
+            return candidate.astimezone(timezone.utc)
+        day += timedelta(days=1)
+
+
+def previous_fire(time_str, tz_name, before, rule=None):
+    """Last aware instant before ``before`` whose local time is time_str.
+
+    With a recurrence rule, the last of the rule's doses instead, looking
+    back one repeat of its pattern; None if it has none in that time.
+    """
+    zone = get_zone(tz_name)
+    day = before.astimezone(zone).date()
+    if rule:
+        doses = occurrences(rule, day - timedelta(days=rule_period(rule)), day)
+    else:
+        doses = [(day - timedelta(days=1), time_str), (day, time_str)]
+    latest = None
+    for day, time_str in doses:
+        hour, minute = (int(part) for part in time_str.split(":"))
+        candidate = datetime(day.year, day.month, day.day, hour, minute, tzinfo=zone)
+        if zone is None:
+            candidate = candidate.astimezone()
+        if candidate < before:
+            latest = candidate.astimezone(timezone.utc)
+    return latest
+
+
+class DoseQueue:
+    """Min-heap of upcoming dose instants across all entries.
+
+    Each entry sits in the heap once, at its next fire time that is not more
+    than DUE_WINDOW_MINUTES in the past. Queries only look at the top of the
+    heap; doses that fall out of the window are re-pushed for the next day.
+    refresh() re-queues a single changed entry; the heap item it replaces
+    is skipped (and eventually pruned) rather than searched for. Queues are
+    shared by every session of a process, so each method holds the
+    queue's lock.
+    """
+
+    def __init__(self, entries, now=None):
+        now = now or datetime.now(timezone.utc)
+        self.window = timedelta(minutes=DUE_WINDOW_MINUTES)
+        self.entries = {}
+        # record id -> sequence number of its live heap item
+        self.queued = {}
+        self.heap = []
+        self._seq = itertools.count()
+        self._lock = threading.RLock()
+        for entry in entries:
+            self._schedule(entry, now)
+        heapq.heapify(self.heap)
+
+    def _live(self, item):
+        return self.queued.get(item[2]) == item[1]
+
+    def _schedule(self, entry, now, push=False):
+        fire = next_fire(entry["time"], entry.get("timezone"), now - self.window, entry.get("rule"))
+        if fire is None:
+            return
+        item = (fire, next(self._seq), entry["id"])
+        self.entries[entry["id"]] = entry
+        self.queued[entry["id"]] = item[1]
+        if push:
+            heapq.heappush(self.heap, item)
+        else:
+            self.heap.append(item)
+
+    def refresh(self, record_id, entry, now=None):
+        """Re-queue one entry after it was added, changed or (entry=None) deleted."""
+        with self._lock:
+            self.entries.pop(record_id, None)
+            self.queued.pop(record_id, None)
+            if entry is not None and entry.get("status") == "Due":
+                self._schedule(entry, now or datetime.now(timezone.utc), push=True)
+            if len(self.heap) > 2 * len(self.queued) + 1024:
+                self.heap = [item for item in self.heap if self._live(item)]
+                heapq.heapify(self.heap)
+
+    def _advance(self, now):
+        while self.heap and (not self._live(self.heap[0]) or self.heap[0][0] < now - self.window):
+            item = heapq.heappop(self.heap)
+            if self._live(item):
+                del self.queued[item[2]]
+                self._schedule(self.entries.pop(item[2]), now, push=True)
+
+    def next_dose(self, now=None):
+        """(fire instant, entry) of the next dose that is not yet overdue."""
+        now = now or datetime.now(timezone.utc)
+        with self._lock:
+            self._advance(now)
+            if not self.heap:
+                return None
+            fire, _, record_id = self.heap[0]
+            return fire, self.entries[record_id]
+
+    def due_now(self, now=None):
+        """Entries whose dose time is within the due window around now."""
+        now = now or datetime.now(timezone.utc)
+        with self._lock:
+            self._advance(now)
+            popped = []
+            while self.heap and self.heap[0][0] <= now + self.window:
+                item = heapq.heappop(self.heap)
+                if self._live(item):
+                    popped.append(item)
+            for item in popped:
+                heapq.heappush(self.heap, item)
+            return [(fire, self.entries[record_id]) for fire, _, record_id in popped]
+
+
+_queues = {}
+_queues_lock = threading.Lock()
+
+
+def dose_queue(store, now=None):
+    """Process-wide DoseQueue of the store's pending ("Due") doses.
+
+    Built once per store; afterwards only the entries the store reports as
+    changed (store.changed_since) are re-queued, so a status change costs
+    one next_fire rather than a rescan of every entry.
+    """
+    key = store.path
+    with _queues_lock:
+        cached = _queues.get(key)
+        token, changed = store.changed_since(cached[0] if cached else None)
+        if changed is None:
+            pending = [entry for entry in store.entries() if entry.get("status") == "Due"]
+            cached = _queues[key] = [token, DoseQueue(pending, now)]
+        else:
+            for record_id in changed:
+                cached[1].refresh(record_id, store.get(record_id), now)
+            cached[0] = token
+        return cached[1]
@@ -0,0 +1,128 @@
+"""Type-ahead search over medicine names.
+
+MedicineIndex answers two kinds of lookups:
+
+- prefixes, from a sorted table of every name and every word in a name
+  (a flattened trie: the names under a prefix are one contiguous slice,
+  found with two binary searches), so "metf" or "500" finds
+  "Metformin 500mg";
+- typos, from a trigram index: names sharing the most three-letter
+  fragments with the query score highest, so "metfromin" still finds it.
+
+medicine_index() builds one index per process from the catalog names plus
+an optional formulary file (MEDTIMER_FORMULARY) and shares it between
+sessions.
+"""
+import bisect
+import csv
+import os
+import re
+from functools import lru_cache
+
+import numpy as np
+
+MIN_SIMILARITY = 0.3
+
+
+def normalize(text):
+    return re.sub(r"[^a-z0-9.]+", " ", text.lower()).strip()
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def load_formulary(path):
+    """Medicine names from a text file (one per line) or a CSV with a
+    "name" column and an optional "strength" column."""
+    with open(path, newline="", encoding="utf-8") as f:
+        if not path.lower().endswith(".csv"):
+            return [line.strip() for line in f if line.strip()]
+        names = []
+        for row in csv.DictReader(f):
+            name = (row.get("name") or "").strip()
+            if name:
+                strength = (row.get("strength") or "").strip()
+                names.append(f"{name} {strength}" if strength else name)
+        return names
+
+
+class MedicineIndex:
+    def __init__(self, names):
+        # Ids follow rank: shorter names first, then alphabetical, so the
+        # best k of any candidate set are simply its k smallest ids.
+        unique = {normalize(name): name for name in names if normalize(name)}
+        ranked = sorted(unique, key=lambda key: (len(key), key))
+        self.names = [unique[key] for key in ranked]
+        self.keys = ranked
+
+        entries = sorted((key, i) for i, key in enumerate(ranked))
+        self._full = [key for key, _ in entries]
+        self._full_ids = np.array([i for _, i in entries], dtype=np.int32)
+        words = sorted((word, i) for i, key in enumerate(ranked) for word in set(key.split()))
+        self._words = [word for word, _ in words]
+        self._word_ids = np.array([i for _, i in words], dtype=np.int32)
+
+        postings = {}
+        self._trigram_counts = np.zeros(len(ranked), dtype=np.int32)
+        for i, key in enumerate(ranked):
+            grams = trigrams(key)
+            self._trigram_counts[i] = len(grams)
+            for gram in grams:
+                postings.setdefault(gram, []).append(i)
+        self._postings = {gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()}
+
+    def __len__(self):
+        return len(self.names)
+
+    @staticmethod
+    def _prefix_slice(table, ids, prefix):
+        lo = bisect.bisect_left(table, prefix)
+        hi = bisect.bisect_left(table, prefix + "\uffff", lo)
+        return ids[lo:hi]
+
+    def prefix(self, query, k=10):
+        key = normalize(query)
+        if not key:
+            return []
+        found = np.sort(self._prefix_slice(self._full, self._full_ids, key))[:k].tolist()
+        if len(found) < k:
+            # Every query word must start some word of the name.
+            candidates = None
+            for word in key.split():
+                ids = np.unique(self._prefix_slice(self._words, self._word_ids, word))
+                candidates = ids if candidates is None else np.intersect1d(candidates, ids, assume_unique=True)
+            seen = set(found)
+            found.extend(i for i in candidates[:k + len(seen)].tolist() if i not in seen)
+        return [self.names[i] for i in found[:k]]
+
+    def fuzzy(self, query, k=10):
+        key = normalize(query)
+        grams = [self._postings[gram] for gram in trigrams(key) if gram in self._postings]
+        if not grams:
+            return []
+        shared = np.bincount(np.concatenate(grams), minlength=len(self.names))
+        scores = shared / (len(trigrams(key)) + self._trigram_counts - shared)
+        best = np.argpartition(-scores, min(k, len(scores) - 1))[:k]
+        best = sorted(best.tolist(), key=lambda i: (-scores[i], i))
+        return [self.names[i] for i in best if scores[i] >= MIN_SIMILARITY]
+
+    def search(self, query, k=10):
+        """Top k names: prefix matches first, then close spellings."""
+        results = self.prefix(query, k)
+        if len(results) < k:
+            results.extend(name for name in self.fuzzy(query, k) if name not in results)
+        return results[:k]
+
+
+@lru_cache(maxsize=4)
+def _build_index(names, formulary_path):
+    if formulary_path:
+        names = names + tuple(load_formulary(formulary_path))
+    return MedicineIndex(names)
+
+
+def medicine_index(names=()):
+    """Process-wide index over names plus the MEDTIMER_FORMULARY file, if set."""
+    return _build_index(tuple(names), os.environ.get("MEDTIMER_FORMULARY"))
@@ -0,0 +1,59 @@
+"""Running totals for Quick Add entries.
+
+The aggregate is a plain dict so it can be stored as JSON next to the data:
+
+    {"total": 3,
+     "status": {"Due": 2, "Taken": 1},
+     "disease": {"Asthma": 3},
+     "country": {"India": 3},
+     "state": {"India / All India": 3},
+     "hour": {"08": 2, "21": 1}}
+
+Stores keep it up to date by applying +1/-1 deltas for the entry that was
+added, removed or changed, so reading it never scans the entries.
+"""
+DIMENSIONS = ["status", "disease", "country", "state", "hour"]
+
+
+def empty_stats():
+    stats = {"total": 0}
+    for dimension in DIMENSIONS:
+        stats[dimension] = {}
+    return stats
+
+
+def entry_keys(entry):
+    return {
+        "status": entry.get("status") or "",
+        "disease": entry.get("disease") or "",
+        "country": entry.get("country") or "",
+        "state": f"{entry.get('country') or ''} / {entry.get('state') or ''}",
+        "hour": (entry.get("time") or "")[:2],
+    }
+
+
+def apply_delta(stats, entry, sign):
+    stats["total"] += sign
+    for dimension, key in entry_keys(entry).items():
+        bucket = stats[dimension]
+        count = bucket.get(key, 0) + sign
+        if count:
+            bucket[key] = count
+        else:
+            bucket.pop(key, None)
+
+
+def compute_stats(entries):
+    stats = empty_stats()
+    for entry in entries:
+        apply_delta(stats, entry, 1)
+    return stats
+
+
+def status_counts(stats):
+    return {
+        "total": stats["total"],
+        "Taken": stats["status"].get("Taken", 0),
+        "Missed": stats["status"].get("Missed", 0),
+        "Due": stats["status"].get("Due", 0),
+    }
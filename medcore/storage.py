@@ -0,0 +1,924 @@
+"""Storage backends for Quick Add medicine entries.
+
+Two backends share the same small interface (entries, counts, add, update,
+delete, clear, replace_all, export):
+
+- JsonStore keeps med_data.json as a snapshot plus an append-only journal.
+- SqliteStore keeps one row per entry with indexes on the columns the app
+  filters and sorts by.
+
+Entries carry a version that goes up on every update. update() takes an
+optional expect={field: value} and only changes fields that still hold the
+expected value, returning the ones that did not, so concurrent sessions
+merge their edits instead of silently overwriting each other.
+
+Both also report which entries changed since a token (changed_since), so
+derived state such as the dose queue is updated rather than rebuilt.
+
+open_store() picks one from the MEDTIMER_STORAGE environment variable. Given
+a user it opens that user's shard, a directory of its own under users/ so
+sessions for different users never read or write each other's files.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import uuid
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking, single process only
+    fcntl = None
+
+from medcore.recurrence import TIME_PATTERN
+from medcore.schedule import ScheduleIndex, time_to_minutes
+from medcore.stats import DIMENSIONS, apply_delta, compute_stats, empty_stats, status_counts
+
+DATA_FILE = "med_data.json"
+JOURNAL_FILE = "med_data.journal"
+STATS_FILE = "med_stats.json"
+DB_FILE = "med_data.db"
+SHARD_ROOT = "users"
+DEFAULT_USER = "default"
+JOURNAL_COMPACT_BYTES = 256 * 1024
+CHANGE_LOG_LIMIT = 10000
+SCHEMA_VERSION = 1
+# Under the shard root: one line per store write naming the shard written,
+# so the reminder service can poll one file instead of every shard.
+CHANGES_FILE = "changes.log"
+CHANGES_ROTATE_BYTES = 1024 * 1024
+
+FIELDS = ["id", "country", "state", "timezone", "disease", "medicine", "time", "notes", "status"]
+INDEXED_FIELDS = ["time", "status", "disease", "country"]
+
+# Parsed JSON datasets shared by every session in this process, keyed on the
+# absolute snapshot path. Each value is (snapshot_key, records, stats,
+# journal_offset, schedule, changes); the snapshot is only re-read when it changed on disk, and
+# journal lines other processes appended are replayed from journal_offset.
+_cache = {}
+_cache_lock = threading.RLock()
+_cache_stats = {"hits": 0, "misses": 0}
+_lock_files = {}
+# One thread lock per path, so sessions writing one store never wait on
+# another store's flock or fsync. _cache_lock only guards the dicts.
+_path_locks = {}
+# SQLite connections shared by every session in this process, keyed on the
+# absolute database path: (connection, lock, inode).
+_connections = {}
+if hasattr(os, "register_at_fork"):
+    # A forked child shares its parent's descriptors and so its flocks and
+    # SQLite handles; give it descriptors of its own.
+    os.register_at_fork(after_in_child=_lock_files.clear)
+    os.register_at_fork(after_in_child=_path_locks.clear)
+    os.register_at_fork(after_in_child=_connections.clear)
+
+
+def _fsync_dir(path):
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def read_json(path):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+
+def write_json_atomic(path, data, indent=4):
+    # Write to a temp file in the same directory, fsync it, then atomically
+    # swap it in so a crash leaves either the old or the new file.
+    fd, tmp_path = tempfile.mkstemp(prefix="." + os.path.basename(path) + ".", suffix=".tmp",
+                                    dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, indent=indent)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    _fsync_dir(path)
+
+
+def new_id():
+    return uuid.uuid4().hex
+
+
+def _file_key(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def _inode(path):
+    key = _file_key(path)
+    return key and key[0]
+
+
+def cache_info():
+    with _cache_lock:
+        return dict(_cache_stats, entries=len(_cache))
+
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
+        _cache_stats["hits"] = 0
+        _cache_stats["misses"] = 0
+
+
+def _path_lock(path):
+    with _cache_lock:
+        lock = _path_locks.get(path)
+        if lock is None:
+            lock = _path_locks[path] = threading.RLock()
+        return lock
+
+
+@contextmanager
+def _file_lock(path, exclusive):
+    # flock on a sidecar file, one descriptor per path per process. Nested
+    # requests reuse a lock already held (an exclusive one covers both).
+    if fcntl is None:
+        yield
+        return
+    with _path_lock(path):
+        with _cache_lock:
+            state = _lock_files.get(path)
+            if state is None:
+                state = _lock_files[path] = [open(path, "a"), None]
+        mode = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+        held = state[1]
+        if held == fcntl.LOCK_EX or held == mode:
+            yield
+            return
+        fcntl.flock(state[0], mode)
+        state[1] = mode
+        try:
+            yield
+        finally:
+            fcntl.flock(state[0], fcntl.LOCK_UN if held is None else held)
+            state[1] = held
+
+
+def _note_change(marker):
+    # marker is (changes file, shard key), set by open_shard(); None for
+    # stores outside the shard layout.
+    if marker is None:
+        return
+    path, key = marker
+    try:
+        if os.path.getsize(path) > CHANGES_ROTATE_BYTES:
+            # Readers notice the new inode and rescan every shard once.
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            open(tmp_path, "w").close()
+            os.replace(tmp_path, path)
+    except FileNotFoundError:
+        pass
+    with open(path, "a") as f:
+        f.write(key + "\n")
+
+
+def changed_shards(root, position):
+    """(position, shard folders written since position); folders is None
+    when they are not known (first call, or the changes file was restarted)."""
+    key = _file_key(os.path.join(root, CHANGES_FILE))
+    inode, size = (key[0], key[2]) if key else (None, 0)
+    if position is None or position[0] != inode or size < position[1]:
+        return (inode, size), None
+    if size == position[1]:
+        return position, []
+    with open(os.path.join(root, CHANGES_FILE), "rb") as f:
+        f.seek(position[1])
+        data = f.read(size - position[1])
+    # A line still being appended is left for the next call.
+    data = data[:data.rfind(b"\n") + 1]
+    keys = dict.fromkeys(data.decode("utf-8").splitlines())
+    return (inode, position[1] + len(data)), [os.path.join(root, key) for key in keys]
+
+
+def merge_fields(entry, fields, expect=None):
+    """Split a write into the fields to apply and the ones that conflict.
+
+    A field conflicts when expect names a value for it and the entry no
+    longer holds that value; fields without an expected value always apply.
+    """
+    expect = expect or {}
+    applied, conflicts = {}, {}
+    for field, value in fields.items():
+        current = entry.get(field)
+        if field in expect and current != expect[field]:
+            conflicts[field] = current
+        else:
+            applied[field] = value
+    return applied, conflicts
+
+
+def _check_change(change):
+    # A journal line is fsynced before it is applied, so anything _apply
+    # would choke on has to be refused before it is written.
+    fields = change["entry"] if change["op"] == "add" else change.get("fields") or {}
+    if change["op"] == "add" or "time" in fields:
+        time_str = fields.get("time")
+        if not isinstance(time_str, str) or not TIME_PATTERN.match(time_str):
+            raise ValueError(f"bad dose time {time_str!r}, expected HH:MM")
+
+
+class ChangeLog:
+    """Ids of changed entries in order, for readers that keep state derived
+    from a store (the dose queue) and update it instead of rescanning.
+
+    Only the last CHANGE_LOG_LIMIT changes are kept; None stands for a
+    change to every entry (clear).
+    """
+
+    def __init__(self):
+        self.ids = []
+        self.start = 0
+
+    @property
+    def end(self):
+        return self.start + len(self.ids)
+
+    def record(self, record_id):
+        self.ids.append(record_id)
+        if len(self.ids) > 2 * CHANGE_LOG_LIMIT:
+            self.start += len(self.ids) - CHANGE_LOG_LIMIT
+            del self.ids[:-CHANGE_LOG_LIMIT]
+
+    def since(self, position):
+        """Ids changed after position, or None if they are not all known."""
+        if position < self.start:
+            return None
+        ids = self.ids[position - self.start:]
+        return None if None in ids else list(dict.fromkeys(ids))
+
+
+class JsonStore:
+    def __init__(self, path=DATA_FILE, journal_path=JOURNAL_FILE, compact_bytes=JOURNAL_COMPACT_BYTES,
+                 stats_path=STATS_FILE):
+        self.path = path
+        self.journal_path = journal_path
+        self.aggregate_path = stats_path
+        self.compact_bytes = compact_bytes
+        self._cache_path = os.path.abspath(path)
+        self._lock_path = self._cache_path + ".lock"
+        self._lock = _path_lock(self._cache_path)
+        self.marker = None
+        with self._lock:
+            with _cache_lock:
+                cached = _cache.get(self._cache_path)
+                hit = cached is not None and cached[0] == _file_key(self.path)
+                _cache_stats["hits" if hit else "misses"] += 1
+            if hit:
+                (self._snapshot_key, self.records, self.aggregate, self._journal_offset, self.schedule,
+                 self.changes) = cached
+                # Only journal lines appended since the cached read are parsed.
+                self._catch_up()
+            else:
+                self._load()
+                self._remember()
+
+    def _disk_key(self):
+        return (_file_key(self.path), _file_key(self.journal_path))
+
+    def _remember(self):
+        # Called after our own writes so this process never re-reads them.
+        with _cache_lock:
+            _cache[self._cache_path] = (self._snapshot_key, self.records, self.aggregate, self._journal_offset,
+                                        self.schedule, self.changes)
+
+    def _read_journal(self, offset):
+        # Returns the complete lines written after offset and the offset just
+        # past the last of them; a line still being appended is left for later.
+        changes = []
+        try:
+            with open(self.journal_path, "rb") as f:
+                f.seek(offset)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    try:
+                        change = json.loads(line)
+                    except ValueError:
+                        # A torn last line from a crash mid-append is ignored.
+                        break
+                    offset += len(line)
+                    changes.append((change, offset))
+        except FileNotFoundError:
+            pass
+        return changes, offset
+
+    def _load(self):
+        self._snapshot_key = _file_key(self.path)
+        data = read_json(self.path)
+        backfill = any("id" not in entry for entry in data)
+        changes, self._journal_offset = self._read_journal(0)
+        changes = [change for change, _ in changes]
+        # Journals written before entries had ids address them by position.
+        legacy = 0
+        while legacy < len(changes) and "id" not in changes[legacy] and "id" not in changes[legacy].get("entry", {}):
+            self._apply_positional(data, changes[legacy])
+            legacy += 1
+        self.records = {}
+        for entry in data:
+            entry.setdefault("id", new_id())
+            self.records[entry["id"]] = entry
+        self.aggregate = None
+        if not backfill and not legacy:
+            saved = read_json(self.aggregate_path)
+            if isinstance(saved, dict) and saved.get("snapshot") == list(self._snapshot_key or []):
+                self.aggregate = saved["stats"]
+        if self.aggregate is None:
+            self.aggregate = compute_stats(self.records.values())
+        self.schedule = ScheduleIndex((record_id, entry["time"]) for record_id, entry in self.records.items())
+        self.changes = ChangeLog()
+        for change in changes[legacy:]:
+            self._apply(change)
+        if backfill or legacy:
+            # Persist backfilled ids so later journal lines can refer to them.
+            self.compact()
+
+    def _catch_up(self, until=None):
+        """Apply journal lines other writers appended since our last read.
+
+        Returns the conflicts of the line ending at offset until, if given.
+        """
+        if _file_key(self.path) != self._snapshot_key:
+            self._load()
+            self._remember()
+            return {}
+        result = {}
+        size = _file_key(self.journal_path)
+        if size is not None and size[2] > self._journal_offset:
+            changes, self._journal_offset = self._read_journal(self._journal_offset)
+            for change, end in changes:
+                conflicts = self._apply(change)
+                if end == until:
+                    result = conflicts
+            self._remember()
+        return result
+
+    @staticmethod
+    def _apply_positional(data, change):
+        op = change["op"]
+        if op == "add":
+            data.append(change["entry"])
+        elif op == "clear":
+            data.clear()
+        elif op == "set":
+            fields = change.get("fields") or {change["field"]: change["value"]}
+            data[change["index"]].update(fields)
+        elif op == "delete":
+            data.pop(change["index"])
+
+    def _apply(self, change):
+        # Every process replays the journal in the same order, so the
+        # compare-and-swap in "set" resolves identically everywhere.
+        try:
+            _check_change(change)
+        except ValueError:
+            # Lines written before changes were checked are skipped.
+            return {}
+        op = change["op"]
+        if op == "add":
+            entry = change["entry"]
+            old = self.records.get(entry["id"])
+            if old is not None:
+                apply_delta(self.aggregate, old, -1)
+                self.schedule.remove(old["id"], old["time"])
+            self.records[entry["id"]] = entry
+            apply_delta(self.aggregate, entry, 1)
+            self.schedule.add(entry["id"], entry["time"])
+            self.changes.record(entry["id"])
+        elif op == "set":
+            entry = self.records.get(change["id"])
+            if entry is None:
+                return dict.fromkeys(change["fields"])
+            applied, conflicts = merge_fields(entry, change["fields"], change.get("expect"))
+            if applied:
+                apply_delta(self.aggregate, entry, -1)
+                if "time" in applied:
+                    self.schedule.remove(entry["id"], entry["time"])
+                    self.schedule.add(entry["id"], applied["time"])
+                entry.update(applied)
+                entry["version"] = entry.get("version", 0) + 1
+                apply_delta(self.aggregate, entry, 1)
+                self.changes.record(entry["id"])
+            return conflicts
+        elif op == "delete":
+            entry = self.records.pop(change["id"], None)
+            if entry is not None:
+                apply_delta(self.aggregate, entry, -1)
+                self.schedule.remove(entry["id"], entry["time"])
+                self.changes.record(entry["id"])
+        elif op == "clear":
+            self.records.clear()
+            self.aggregate.update(empty_stats())
+            self.schedule.clear()
+            self.changes.record(None)
+        return {}
+
+    def _record(self, *changes):
+        for change in changes:
+            _check_change(change)
+        with self._lock:
+            # Appenders share the lock; only compaction, which rewrites the
+            # snapshot and drops the journal, needs it exclusively. A batch
+            # may be split across several writes, so it takes it exclusively
+            # too rather than interleave with other appenders.
+            with _file_lock(self._lock_path, exclusive=len(changes) > 1):
+                self._catch_up()
+                with open(self.journal_path, "a") as f:
+                    f.write("".join(json.dumps(change, separators=(",", ":")) + "\n" for change in changes))
+                    f.flush()
+                    os.fsync(f.fileno())
+                    end = f.tell()
+                conflicts = self._catch_up(until=end)
+            _note_change(self.marker)
+            # Compaction rewrites the whole snapshot, so the journal may grow
+            # to the snapshot's size first; bulk imports then rewrite it a
+            # few times in all instead of once every few batches.
+            snapshot_size = self._snapshot_key[2] if self._snapshot_key else 0
+            if self._journal_offset > max(self.compact_bytes, snapshot_size):
+                self.compact()
+            return conflicts
+
+    def compact(self):
+        with self._lock, _file_lock(self._lock_path, exclusive=True):
+            self._catch_up()
+            self._write_snapshot()
+
+    def _write_snapshot(self):
+        write_json_atomic(self.path, list(self.records.values()))
+        self._snapshot_key = _file_key(self.path)
+        # The stats file names the snapshot it describes, so a crash
+        # between the two writes just means recomputing on next load.
+        write_json_atomic(self.aggregate_path, {"snapshot": list(self._snapshot_key), "stats": self.aggregate},
+                          indent=None)
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+            _fsync_dir(self.journal_path)
+        self._journal_offset = 0
+        self._remember()
+
+    def get(self, record_id):
+        return self.records.get(record_id)
+
+    @staticmethod
+    def _window_minutes(start, end):
+        if start is None:
+            return None, None
+        return time_to_minutes(start), time_to_minutes(end)
+
+    def entries(self, offset=0, limit=None, start=None, end=None):
+        # records and schedule are shared with other sessions' writes.
+        with self._lock:
+            ids = self.schedule.select(*self._window_minutes(start, end), offset=offset, limit=limit)
+            return [self.records[record_id] for record_id in ids]
+
+    def count_entries(self, start=None, end=None):
+        with self._lock:
+            return self.schedule.count(*self._window_minutes(start, end))
+
+    def stats(self):
+        return self.aggregate
+
+    def revision(self):
+        return self._disk_key()
+
+    def changed_since(self, token):
+        """(token, ids of entries changed since token); ids is None when
+        they are not known (first call, or the dataset was reloaded)."""
+        with self._lock:
+            changes = self.changes
+            ids = changes.since(token[1]) if token is not None and token[0] is changes else None
+            return (changes, changes.end), ids
+
+    def counts(self):
+        return status_counts(self.aggregate)
+
+    def add(self, entry):
+        self.add_many([entry])
+
+    def add_many(self, entries):
+        """Append many entries with a single journal write and fsync."""
+        changes = []
+        for entry in entries:
+            entry.setdefault("id", new_id())
+            entry.setdefault("version", 1)
+            changes.append({"op": "add", "entry": entry})
+        if changes:
+            self._record(*changes)
+
+    def update(self, record_id, expect=None, **fields):
+        """Set fields on one entry; returns {field: current value} for conflicts.
+
+        With expect={field: value}, a field is only changed if it still holds
+        the expected value. Other fields in the
+        same call are still applied, so concurrent edits to different fields
+        merge instead of overwriting each other.
+        """
+        change = {"op": "set", "id": record_id, "fields": fields}
+        if expect:
+            change["expect"] = expect
+        return self._record(change)
+
+    def delete(self, record_id):
+        self._record({"op": "delete", "id": record_id})
+
+    def clear(self):
+        with self._lock, _file_lock(self._lock_path, exclusive=True):
+            self._apply({"op": "clear"})
+            self._write_snapshot()
+        _note_change(self.marker)
+
+    def replace_all(self, entries):
+        for entry in entries:
+            _check_change({"op": "add", "entry": entry})
+        with self._lock, _file_lock(self._lock_path, exclusive=True):
+            self._apply({"op": "clear"})
+            for entry in entries:
+                entry.setdefault("id", new_id())
+                entry.setdefault("version", 1)
+                self._apply({"op": "add", "entry": entry})
+            self._write_snapshot()
+        _note_change(self.marker)
+
+    def export(self):
+        with self._lock:
+            return list(self.records.values())
+
+    def iter_entries(self):
+        yield from self.entries()
+
+
+class SqliteStore:
+    def __init__(self, path=DB_FILE):
+        self.path = path
+        self.marker = None
+        key = os.path.abspath(path)
+        with _cache_lock:
+            cached = _connections.get(key)
+            if cached is None or cached[2] != _inode(path):
+                # Not opened yet in this process, or the file was replaced.
+                self.conn = sqlite3.connect(path, check_same_thread=False)
+                self.conn.row_factory = sqlite3.Row
+                self._lock = threading.RLock()
+                self._create_schema()
+                cached = _connections[key] = (self.conn, self._lock, _inode(path))
+        # Sessions share the connection, so each call holds its lock.
+        self.conn, self._lock, _ = cached
+
+    def _create_schema(self):
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+            return
+        with self.conn:
+            # Take the write lock up front: a transaction that reads first and
+            # writes later fails outright when another process got there first.
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS medicines (rowid INTEGER PRIMARY KEY, "
+                + ", ".join(f"{field} TEXT" for field in FIELDS) + ")")
+            existing = {row["name"] for row in self.conn.execute("PRAGMA table_info(medicines)")}
+            for field in FIELDS:
+                if field not in existing:
+                    self.conn.execute(f"ALTER TABLE medicines ADD COLUMN {field} TEXT")
+            if "version" not in existing:
+                self.conn.execute("ALTER TABLE medicines ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+            if "rule" not in existing:
+                self.conn.execute("ALTER TABLE medicines ADD COLUMN rule TEXT")
+            for field in INDEXED_FIELDS:
+                self.conn.execute(f"CREATE INDEX IF NOT EXISTS idx_medicines_{field} ON medicines ({field})")
+            missing = [row[0] for row in self.conn.execute("SELECT rowid FROM medicines WHERE id IS NULL")]
+            self.conn.executemany("UPDATE medicines SET id = ? WHERE rowid = ?",
+                                  ((new_id(), rowid) for rowid in missing))
+            self.conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_medicines_id ON medicines (id)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS stats (dimension TEXT NOT NULL, key TEXT NOT NULL, "
+                              "count INTEGER NOT NULL, PRIMARY KEY (dimension, key))")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            self.conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('revision', 0)")
+            # Ids of changed rows, NULL for all of them; see changed_since().
+            self.conn.execute("CREATE TABLE IF NOT EXISTS changes (seq INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT)")
+            if self.conn.execute("SELECT 1 FROM stats LIMIT 1").fetchone() is None:
+                self._rebuild_stats()
+            self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _rebuild_stats(self):
+        self.conn.execute("DELETE FROM stats")
+        stats = compute_stats(self._entry(row) for row in self.conn.execute("SELECT * FROM medicines"))
+        self._write_stats_delta(stats)
+
+    def _bump_revision(self):
+        self.conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'revision'")
+
+    def _read(self, sql, params=()):
+        with self._lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def revision(self):
+        return self._read("SELECT value FROM meta WHERE key = 'revision'")[0][0]
+
+    def _log_changes(self, ids):
+        self.conn.executemany("INSERT INTO changes (id) VALUES (?)", ((record_id,) for record_id in ids))
+        self.conn.execute("DELETE FROM changes WHERE seq <= (SELECT MAX(seq) FROM changes) - ?", (CHANGE_LOG_LIMIT,))
+
+    def changed_since(self, token):
+        """(token, ids of entries changed since token); ids is None when
+        they are not known (first call, or older changes were trimmed)."""
+        if token is None:
+            return self._read("SELECT COALESCE(MAX(seq), 0) FROM changes")[0][0], None
+        oldest = self._read("SELECT MIN(seq) FROM changes")[0][0]
+        rows = self._read("SELECT seq, id FROM changes WHERE seq > ? ORDER BY seq", (token,))
+        if not rows:
+            return token, []
+        ids = [row["id"] for row in rows]
+        if token < oldest - 1 or None in ids:
+            return rows[-1]["seq"], None
+        return rows[-1]["seq"], list(dict.fromkeys(ids))
+
+    def _write_stats_delta(self, delta):
+        rows = [("", "total", delta["total"])]
+        for dimension in DIMENSIONS:
+            rows.extend((dimension, key, count) for key, count in delta[dimension].items())
+        self.conn.executemany(
+            "INSERT INTO stats (dimension, key, count) VALUES (?, ?, ?) "
+            "ON CONFLICT (dimension, key) DO UPDATE SET count = count + excluded.count", rows)
+        self.conn.execute("DELETE FROM stats WHERE count = 0 AND dimension != ''")
+        self._bump_revision()
+
+    @staticmethod
+    def _entry(row):
+        entry = {field: row[field] for field in FIELDS}
+        entry["version"] = row["version"]
+        if row["rule"]:
+            entry["rule"] = json.loads(row["rule"])
+        return entry
+
+    @staticmethod
+    def _column_value(field, value):
+        # Recurrence rules are dicts, kept as JSON text.
+        if field == "rule" and value is not None:
+            return json.dumps(value, separators=(",", ":"))
+        return value
+
+    def get(self, record_id):
+        rows = self._read("SELECT * FROM medicines WHERE id = ?", (record_id,))
+        return self._entry(rows[0]) if rows else None
+
+    @staticmethod
+    def _window_clause(start, end):
+        if start is None:
+            return "", []
+        if start <= end:
+            return " WHERE time BETWEEN ? AND ?", [start, end]
+        return " WHERE (time >= ? OR time <= ?)", [start, end]
+
+    def entries(self, offset=0, limit=None, start=None, end=None):
+        where, params = self._window_clause(start, end)
+        # A window past midnight lists its evening doses first.
+        order, order_params = ("time < ?, ", [start]) if start is not None and start > end else ("", [])
+        rows = self._read(f"SELECT * FROM medicines{where} ORDER BY {order}time, id LIMIT ? OFFSET ?",
+                          params + order_params + [-1 if limit is None else limit, offset])
+        return [self._entry(row) for row in rows]
+
+    def count_entries(self, start=None, end=None):
+        where, params = self._window_clause(start, end)
+        return self._read(f"SELECT COUNT(*) FROM medicines{where}", params)[0][0]
+
+    def stats(self):
+        stats = empty_stats()
+        for row in self._read("SELECT dimension, key, count FROM stats"):
+            if row["dimension"] == "":
+                stats["total"] = row["count"]
+            else:
+                stats[row["dimension"]][row["key"]] = row["count"]
+        return stats
+
+    def counts(self):
+        counts = {"total": 0, "Taken": 0, "Missed": 0, "Due": 0}
+        for row in self._read("SELECT dimension, key, count FROM stats WHERE dimension IN ('', 'status')"):
+            counts[row["key"]] = row["count"]
+        return counts
+
+    def add(self, entry):
+        self.add_many([entry])
+
+    def add_many(self, entries):
+        columns = FIELDS + ["rule"]
+        placeholders = ", ".join("?" for _ in columns)
+        rows = []
+        delta = empty_stats()
+        for entry in entries:
+            entry.setdefault("id", new_id())
+            rows.append([self._column_value(field, entry.get(field)) for field in columns])
+            apply_delta(delta, entry, 1)
+        with self._lock, self.conn:
+            self.conn.executemany(
+                f"INSERT INTO medicines ({', '.join(columns)}) VALUES ({placeholders})", rows)
+            self._log_changes(entry["id"] for entry in entries)
+            self._write_stats_delta(delta)
+        _note_change(self.marker)
+
+    def update(self, record_id, expect=None, **fields):
+        fields = {field: value for field, value in fields.items() if field in FIELDS or field == "rule"}
+        while True:
+            old = self.get(record_id)
+            if old is None:
+                return dict.fromkeys(fields)
+            applied, conflicts = merge_fields(old, fields, expect)
+            if not applied:
+                return conflicts
+            assignments = ", ".join(f"{field} = ?" for field in applied)
+            with self._lock, self.conn:
+                # Only succeeds if nobody wrote the row since we read it;
+                # otherwise re-read and merge against the newer row.
+                cursor = self.conn.execute(
+                    f"UPDATE medicines SET {assignments}, version = version + 1 WHERE id = ? AND version = ?",
+                    [self._column_value(field, value) for field, value in applied.items()]
+                    + [record_id, old["version"]])
+                if cursor.rowcount == 0:
+                    continue
+                self._log_changes([record_id])
+                delta = empty_stats()
+                apply_delta(delta, old, -1)
+                apply_delta(delta, dict(old, **applied), 1)
+                self._write_stats_delta(delta)
+            _note_change(self.marker)
+            return conflicts
+
+    def delete(self, record_id):
+        while True:
+            old = self.get(record_id)
+            if old is None:
+                return
+            with self._lock, self.conn:
+                # Another writer may have deleted or changed the row since
+                # we read it; only the delete that removes it counts it.
+                cursor = self.conn.execute("DELETE FROM medicines WHERE id = ? AND version = ?",
+                                           (record_id, old["version"]))
+                if cursor.rowcount == 0:
+                    continue
+                self._log_changes([record_id])
+                delta = empty_stats()
+                apply_delta(delta, old, -1)
+                self._write_stats_delta(delta)
+            _note_change(self.marker)
+            return
+
+    def clear(self):
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM medicines")
+            self.conn.execute("DELETE FROM stats")
+            self._log_changes([None])
+            self._write_stats_delta(empty_stats())
+        _note_change(self.marker)
+
+    def replace_all(self, entries):
+        with self._lock:
+            self.clear()
+            self.add_many(entries)
+
+    def export(self):
+        return self.entries()
+
+    def iter_entries(self):
+        """Entries in time order, read lazily on a connection of their own."""
+        conn = sqlite3.connect(self.path)
+        conn.row_factory = sqlite3.Row
+        try:
+            for row in conn.execute("SELECT * FROM medicines ORDER BY time, id"):
+                yield self._entry(row)
+        finally:
+            conn.close()
+
+    def compact(self):
+        with self._lock:
+            self.conn.execute("VACUUM")
+
+    def is_empty(self):
+        return not self._read("SELECT 1 FROM medicines LIMIT 1")
+
+
+def migrate_json_to_sqlite(json_path=DATA_FILE, db_path=DB_FILE, journal_path=JOURNAL_FILE):
+    """Copy a med_data.json (plus journal) into an empty SQLite database.
+
+    Returns the number of migrated entries, or 0 if the database already
+    had rows.
+    """
+    store = SqliteStore(db_path)
+    if not store.is_empty():
+        return 0
+    entries = JsonStore(json_path, journal_path).export()
+    store.add_many(entries)
+    return len(entries)
+
+
+def shard_dir(user, root=SHARD_ROOT):
+    """Directory holding one user's files, fanned out as users/ab/cd/<sha256>."""
+    digest = hashlib.sha256(user.strip().lower().encode("utf-8")).hexdigest()
+    return os.path.join(root, digest[:2], digest[2:4], digest)
+
+
+def shard_folders(root=SHARD_ROOT):
+    """Every shard directory under root, in a stable order."""
+    if not os.path.isdir(root):
+        return []
+    return sorted(os.path.join(root, a, b, digest)
+                  for a in os.listdir(root) if os.path.isdir(os.path.join(root, a))
+                  for b in os.listdir(os.path.join(root, a)) if os.path.isdir(os.path.join(root, a, b))
+                  for digest in os.listdir(os.path.join(root, a, b)))
+
+
+def open_shard(folder, backend=None):
+    backend = backend or os.environ.get("MEDTIMER_STORAGE", "json")
+    os.makedirs(folder, exist_ok=True)
+    data_path = os.path.join(folder, DATA_FILE)
+    if backend == "sqlite":
+        db_path = os.path.join(folder, DB_FILE)
+        if not os.path.exists(db_path) and os.path.exists(data_path):
+            migrate_json_to_sqlite(data_path, db_path, os.path.join(folder, JOURNAL_FILE))
+        store = SqliteStore(db_path)
+    else:
+        store = JsonStore(data_path, os.path.join(folder, JOURNAL_FILE), stats_path=os.path.join(folder, STATS_FILE))
+    # Shards sit at <root>/ab/cd/<digest>; writes are noted in <root>/changes.log.
+    root = os.path.dirname(os.path.dirname(os.path.dirname(folder)))
+    store.marker = (os.path.join(root, CHANGES_FILE), os.path.relpath(folder, root or os.curdir))
+    return store
+
+
+def split_into_shards(source, root=SHARD_ROOT, backend="json"):
+    """Copy entries of a global store into per-user shards.
+
+    Entries carrying a "user" field go to that user's shard; the rest go to
+    the default user. Returns the number of entries written per user.
+    """
+    groups = {}
+    for entry in source.export():
+        user = entry.pop("user", None) or DEFAULT_USER
+        groups.setdefault(user, []).append(entry)
+    for user, entries in groups.items():
+        store = open_shard(shard_dir(user, root), backend)
+        store.replace_all(store.export() + entries)
+    return {user: len(entries) for user, entries in groups.items()}
+
+
+def split_legacy_store(backend=None, root=SHARD_ROOT):
+    """Split an old global store into shards under root, once.
+
+    Nothing happens when root already exists or there is no global store.
+    """
+    backend = backend or os.environ.get("MEDTIMER_STORAGE", "json")
+    global_path = os.environ.get("MEDTIMER_DB", DB_FILE) if backend == "sqlite" else DATA_FILE
+    if (os.path.exists(global_path) or os.path.exists(DATA_FILE)) and not os.path.isdir(root):
+        # First sharded open next to an old global file: whoever creates the
+        # shard root does the one-time split.
+        try:
+            os.makedirs(root)
+        except FileExistsError:
+            pass
+        else:
+            split_into_shards(open_store(backend), root=root, backend=backend)
+
+
+def open_store(backend=None, user=None, root=SHARD_ROOT):
+    backend = backend or os.environ.get("MEDTIMER_STORAGE", "json")
+    if user is None:
+        if backend == "sqlite":
+            db_path = os.environ.get("MEDTIMER_DB", DB_FILE)
+            if not os.path.exists(db_path) and os.path.exists(DATA_FILE):
+                migrate_json_to_sqlite(DATA_FILE, db_path)
+            return SqliteStore(db_path)
+        return JsonStore()
+    split_legacy_store(backend, root)
+    return open_shard(shard_dir(user, root), backend)
+
+
+if __name__ == "__main__":
+    import sys
+    if sys.argv[1:2] == ["split"]:
+        json_path = sys.argv[2] if len(sys.argv) > 2 else DATA_FILE
+        root = sys.argv[3] if len(sys.argv) > 3 else SHARD_ROOT
+        for user, count in split_into_shards(JsonStore(json_path), root=root).items():
+            print(f"{user}: {count} entries -> {shard_dir(user, root)}")
+        sys.exit()
+    json_path = sys.argv[1] if len(sys.argv) > 1 else DATA_FILE
+    db_path = sys.argv[2] if len(sys.argv) > 2 else DB_FILE
+    print(f"Migrated {migrate_json_to_sqlite(json_path, db_path)} entries into {db_path}")
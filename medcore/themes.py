@@ -0,0 +1,579 @@
+"""Theme palettes and the app stylesheet.
+
+The stylesheet only depends on the theme and the text size, so each
+combination is rendered once per process, minified and keyed by a content
+hash. The app uses the hash to skip re-sending a stylesheet the browser
+already has.
+"""
+import hashlib
+import json
+import re
+from functools import lru_cache
+
+THEMES = {
+    "Sage Garden 🌿": {
+        "primary": "#A7C4A0",
+        "secondary": "#8A9A5B",
+        "background": "linear-gradient(to bottom, #FFFCF7 0%, #F5F0E6 50%, #DDEAF2 100%)",
+        "card_bg": "linear-gradient(135deg, #FFFFFF 0%, #F5F0E6 100%)",
+        "text": "#2C3E2F",
+        "button_gradient": "linear-gradient(135deg, #A7C4A0 0%, #8A9A5B 100%)",
+        "button_hover": "linear-gradient(135deg, #8A9A5B 0%, #6B7A46 100%)",
+        "icon": "🌿"
+    },
+    "Ocean Breeze 🌊": {
+        "primary": "#4A90A4",
+        "secondary": "#2E6F85",
+        "background": "linear-gradient(to bottom, #E0F2F7 0%, #B3E5F0 50%, #81D4E8 100%)",
+        "card_bg": "linear-gradient(135deg, #FFFFFF 0%, #E0F7FA 100%)",
+        "text": "#1B3A47",
+        "button_gradient": "linear-gradient(135deg, #4DD0E1 0%, #26C6DA 100%)",
+        "button_hover": "linear-gradient(135deg, #26C6DA 0%, #00ACC1 100%)",
+        "icon": "🌊"
+    },
+    "Sunset Warmth 🌅": {
+        "primary": "#E8956B",
+        "secondary": "#D97847",
+        "background": "linear-gradient(to bottom, #FFF8E1 0%, #FFE0B2 50%, #FFCCBC 100%)",
+        "card_bg": "linear-gradient(135deg, #FFFFFF 0%, #FFF3E0 100%)",
+        "text": "#4E2A1B",
+        "button_gradient": "linear-gradient(135deg, #FFB74D 0%, #FF9800 100%)",
+        "button_hover": "linear-gradient(135deg, #FF9800 0%, #F57C00 100%)",
+        "icon": "🌅"
+    },
+    "Lavender Dreams 💜": {
+        "primary": "#B39DDB",
+        "secondary": "#9575CD",
+        "background": "linear-gradient(to bottom, #F3E5F5 0%, #E1BEE7 50%, #CE93D8 100%)",
+        "card_bg": "linear-gradient(135deg, #FFFFFF 0%, #F3E5F5 100%)",
+        "text": "#4A148C",
+        "button_gradient": "linear-gradient(135deg, #BA68C8 0%, #AB47BC 100%)",
+        "button_hover": "linear-gradient(135deg, #AB47BC 0%, #9C27B0 100%)",
+        "icon": "💜"
+    },
+    "Spring Blossom 🌸": {
+        "primary": "#F48FB1",
+        "secondary": "#EC407A",
+        "background": "linear-gradient(to bottom, #FCE4EC 0%, #F8BBD0 50%, #F48FB1 100%)",
+        "card_bg": "linear-gradient(135deg, #FFFFFF 0%, #FCE4EC 100%)",
+        "text": "#880E4F",
+        "button_gradient": "linear-gradient(135deg, #F48FB1 0%, #EC407A 100%)",
+        "button_hover": "linear-gradient(135deg, #EC407A 0%, #E91E63 100%)",
+        "icon": "🌸"
+    }
+}
+
+FONT_SIZES = [18, 20, 22, 24]
+
+
+def render_stylesheet(theme, font_size_value):
+    selected_font_size = f"{font_size_value}px"
+
+    base_size = int(selected_font_size.replace("px", ""))
+    heading_size = f"{base_size + 8}px"
+    subheading_size = f"{base_size + 4}px"
+    label_size = f"{base_size + 2}px"
+
+    return f"""
+  <style>
+  @import url('https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700&display=swap');
+  
+  * {{
+    font-family: 'Inter', -apple-system, BlinkMacSystemFont, 'Segoe UI', sans-serif !important;
+  }}
+  
+  body, .stApp, [data-testid="stAppViewContainer"], [data-testid="stHeader"] {{
+    background: {theme['background']} !important;
+  }}
+  
+  [data-testid="stSidebar"] {{
+    background: {theme['card_bg']} !important;
+    border-right: 3px solid {theme['primary']} !important;
+    min-width: 320px !important;
+    max-width: 320px !important;
+  }}
+  
+  [data-testid="stSidebar"] * {{
+    color: {theme['text']} !important;
+  }}
+  
+  [data-testid="stSidebar"] > div:first-child {{
+    padding: 2rem 1.5rem !important;
+  }}
+  
+  input[type="text"] {{
+    -webkit-autocomplete: off !important;
+    autocomplete: off !important;
+  }}
+  
+  input, textarea,
+  .stTextInput input, .stTextArea textarea, 
+  .stTimeInput input, .stNumberInput input
+  {{
+    background: {theme['card_bg']} !important;
+    color: #000000 !important;
+    border-radius: 10px !important;
+    border: 2.5px solid {theme['primary']} !important;
+    font-weight: 500 !important;
+    font-size: {selected_font_size} !important;
+    padding: 14px 18px !important;
+    height: auto !important;
+    min-height: 50px !important;
+    line-height: 1.5 !important;
+    box-shadow: 0 2px 8px rgba(0, 0, 0, 0.1) !important;
+    transition: all 0.3s ease !important;
+    width: 100% !important;
+    box-sizing: border-box !important;
+  }}
+  
+  input::placeholder, textarea::placeholder {{
+    color: #666666 !important;
+    opacity: 0.8 !important;
+    font-weight: 400 !important;
+    font-size: {selected_font_size} !important;
+  }}
+  
+  input:focus, textarea:focus {{
+    border-color: {theme['secondary']} !important;
+    box-shadow: 0 3px 12px rgba(0, 0, 0, 0.15), 0 0 0 3px rgba(0, 0, 0, 0.05) !important;
+    transform: translateY(-1px) !important;
+    outline: none !important;
+  }}
+  
+  /* DROPDOWN FIXES */
+  .stSelectbox > div {{
+    width: 100% !important;
+    max-width: 100% !important;
+  }}
+  
+  .stSelectbox > div > div {{
+    background: transparent !important;
+    border: none !important;
+    padding: 0 !important;
+  }}
+  
+  /* Main dropdown container with solid borders on ALL sides */
+  div[data-baseweb="select"] {{
+    background: {theme['card_bg']} !important;
+    border-radius: 10px !important;
+    border: 2.5px solid {theme['primary']} !important;
+    padding: 0 !important;
+    box-shadow: 0 2px 8px rgba(0, 0, 0, 0.1) !important;
+    transition: all 0.3s ease !important;
+  }}
+  
+  div[data-baseweb="select"]:hover {{
+    box-shadow: 0 3px 12px rgba(0, 0, 0, 0.15) !important;
+    border-color: {theme['secondary']} !important;
+  }}
+  
+  /* Inner dropdown padding */
+  div[data-baseweb="select"] > div {{
+    background: transparent !important;
+    border: none !important;
+    padding: 14px 18px !important;
+    min-height: 50px !important;
+    width: 100% !important;
+  }}
+  
+  div[data-baseweb="select"] > div > div {{
+    background: transparent !important;
+    border: none !important;
+    padding: 0 !important;
+    width: 100% !important;
+  }}
+  
+  /* NUCLEAR OPTION - Force all dropdown text to be BLACK and VISIBLE */
+  div[data-baseweb="select"],
+  div[data-baseweb="select"] *,
+  div[data-baseweb="select"] span,
+  div[data-baseweb="select"] div,
+  div[data-baseweb="select"] input,
+  div[data-baseweb="select"] [role="button"],
+  div[data-baseweb="select"] [role="button"] *,
+  div[data-baseweb="select"] [data-baseweb="select-value"],
+  div[data-baseweb="select"] [data-baseweb="select-value"] * {{
+    color: #000000 !important;
+    -webkit-text-fill-color: #000000 !important;
+    font-weight: 600 !important;
+    opacity: 1 !important;
+    font-size: {selected_font_size} !important;
+  }}
+  
+  /* Dropdown arrow */
+  div[data-baseweb="select"] svg {{
+    color: {theme['secondary']} !important;
+    fill: {theme['secondary']} !important;
+    width: 20px !important;
+    height: 20px !important;
+  }}
+  
+  .stTimeInput input {{
+    height: auto !important;
+    min-height: 50px !important;
+    padding: 14px 18px !important;
+    font-size: {selected_font_size} !important;
+  }}
+  
+  /* Dropdown menu items */
+  ul[role="listbox"] {{
+    background: {theme['card_bg']} !important;
+    max-height: 320px !important;
+    min-width: 100% !important;
+    border-radius: 10px !important;
+    border: 2.5px solid {theme['primary']} !important;
+    box-shadow: 0 8px 24px rgba(0, 0, 0, 0.2) !important;
+    padding: 8px !important;
+  }}
+  
+  ul[role="listbox"] li {{
+    background: transparent !important;
+    color: #000000 !important;
+    padding: 12px 16px !important;
+    font-size: {selected_font_size} !important;
+    font-weight: 500 !important;
+    border-radius: 8px !important;
+    margin: 4px 0 !important;
+    transition: all 0.25s ease !important;
+  }}
+  
+  ul[role="listbox"] li:hover {{
+    background: {theme['button_gradient']} !important;
+    color: #FFFFFF !important;
+    transform: translateX(4px) !important;
+    box-shadow: 0 2px 8px rgba(0, 0, 0, 0.15) !important;
+  }}
+  
+  label, .stSelectbox label, .stTextInput label, 
+  .stTextArea label, .stNumberInput label, 
+  .stTimeInput label, .stFileUploader label {{
+    color: {theme['text']} !important;
+    font-weight: 600 !important;
+    font-size: {label_size} !important;
+    margin-bottom: 10px !important;
+    display: block !important;
+    letter-spacing: 0.3px !important;
+  }}
+  
+  div.stButton button, .stDownloadButton button {{
+    background: {theme['button_gradient']} !important;
+    color: #FFFFFF !important;
+    border-radius: 10px !important;
+    border: none !important;
+    font-weight: 600 !important;
+    font-size: {selected_font_size} !important;
+    padding: 12px 24px !important;
+    transition: all 0.35s ease !important;
+    width: 100% !important;
+    min-height: 48px !important;
+    max-height: 48px !important;
+    box-shadow: 0 3px 10px rgba(0, 0, 0, 0.15) !important;
+    letter-spacing: 0.5px !important;
+    position: relative !important;
+    overflow: hidden !important;
+    cursor: pointer !important;
+  }}
+  
+  div.stButton button::after {{
+    content: '' !important;
+    position: absolute !important;
+    top: 50% !important;
+    left: 50% !important;
+    width: 0 !important;
+    height: 0 !important;
+    border-radius: 50% !important;
+    background: rgba(255, 255, 255, 0.4) !important;
+    transform: translate(-50%, -50%) !important;
+    transition: width 0.5s ease, height 0.5s ease !important;
+  }}
+  
+  div.stButton button:hover {{
+    background: {theme['button_hover']} !important;
+    transform: translateY(-2px) !important;
+    box-shadow: 0 5px 15px rgba(0, 0, 0, 0.25) !important;
+  }}
+  
+  div.stButton button:active::after {{
+    width: 300px !important;
+    height: 300px !important;
+  }}
+  
+  div.stButton button:active {{
+    transform: translateY(0px) scale(0.98) !important;
+  }}
+  
+  h1, h2, h3, h4, h5, h6 {{
+    color: {theme['text']} !important;
+    font-weight: 700 !important;
+    letter-spacing: 0.5px !important;
+    line-height: 1.4 !important;
+  }}
+  
+  h1 {{
+    font-size: {heading_size} !important;
+    margin-bottom: 0.5rem !important;
+  }}
+  
+  h2 {{
+    font-size: {subheading_size} !important;
+  }}
+  
+  h3 {{
+    font-size: {label_size} !important;
+  }}
+  
+  .step-indicator {{
+    text-align: center;
+    font-size: {label_size};
+    font-weight: 600;
+    color: #FFFFFF;
+    background: {theme['button_gradient']};
+    padding: 16px 24px;
+    border-radius: 10px;
+    margin: 20px auto;
+    max-width: 600px;
+    box-shadow: 0 3px 12px rgba(0, 0, 0, 0.2);
+    border: 2px solid {theme['secondary']};
+    animation: gentle-glow 3s ease-in-out infinite alternate;
+    letter-spacing: 0.8px;
+  }}
+  
+  @keyframes gentle-glow {{
+    from {{
+      box-shadow: 0 3px 12px rgba(0, 0, 0, 0.2);
+    }}
+    to {{
+      box-shadow: 0 5px 18px rgba(0, 0, 0, 0.3);
+    }}
+  }}
+  
+  .stAlert, div[data-baseweb="notification"] {{
+    background: {theme['card_bg']} !important;
+    color: {theme['text']} !important;
+    border: 2px solid {theme['primary']} !important;
+    border-radius: 10px !important;
+    padding: 16px 20px !important;
+    box-shadow: 0 2px 10px rgba(0, 0, 0, 0.1) !important;
+    font-size: {selected_font_size} !important;
+  }}
+  
+  .element-container div[data-testid="stMarkdownContainer"] p {{
+    color: {theme['text']} !important;
+    font-size: {selected_font_size} !important;
+  }}
+  
+  .stFileUploader, section[data-testid="stFileUploader"],
+  [data-testid="stFileUploader"] > div,
+  [data-testid="stFileUploader"] section {{
+    background: {theme['card_bg']} !important;
+    border: 2.5px solid {theme['primary']} !important;
+    border-radius: 10px !important;
+    padding: 20px !important;
+    box-shadow: 0 2px 10px rgba(0, 0, 0, 0.1) !important;
+  }}
+  
+  section[data-testid="stFileUploadDropzone"],
+  section[data-testid="stFileUploadDropzone"] > div,
+  section[data-testid="stFileUploadDropzone"] > div > div,
+  [data-testid="stFileUploadDropzone"] div {{
+    background: {theme['card_bg']} !important;
+    border-radius: 8px !important;
+    border: 2.5px dashed {theme['primary']} !important;
+    color: {theme['text']} !important;
+    padding: 20px !important;
+  }}
+  
+  section[data-testid="stFileUploadDropzone"] small,
+  section[data-testid="stFileUploadDropzone"] span,
+  [data-testid="stFileUploadDropzone"] small,
+  [data-testid="stFileUploadDropzone"] span,
+  [data-testid="stFileUploadDropzone"] p,
+  section[data-testid="stFileUploadDropzone"] p,
+  section[data-testid="stFileUploadDropzone"] div,
+  [data-testid="stFileUploadDropzone"] div {{
+    color: #000000 !important;
+    font-weight: 500 !important;
+    font-size: {selected_font_size} !important;
+  }}
+  
+  section[data-testid="stFileUploadDropzone"] button,
+  [data-testid="stFileUploadDropzone"] button {{
+    background: {theme['button_gradient']} !important;
+    color: #FFFFFF !important;
+    border: none !important;
+    border-radius: 8px !important;
+    padding: 10px 20px !important;
+    font-weight: 600 !important;
+    font-size: {selected_font_size} !important;
+    transition: all 0.3s ease !important;
+  }}
+  
+  section[data-testid="stFileUploadDropzone"] button:hover {{
+    transform: scale(1.05) !important;
+    box-shadow: 0 3px 12px rgba(0, 0, 0, 0.2) !important;
+  }}
+  
+  .stTextInput > div, .stSelectbox > div, .stTimeInput > div {{
+    border: none !important;
+    background: transparent !important;
+    border-bottom: none !important;
+  }}
+  
+  .med-card {{
+    background: {theme['card_bg']};
+    border: 2.5px solid {theme['primary']};
+    border-radius: 12px;
+    padding: 22px;
+    margin: 16px 0;
+    box-shadow: 0 3px 12px rgba(0, 0, 0, 0.12);
+    transition: all 0.3s ease;
+    position: relative;
+    overflow: hidden;
+  }}
+  
+  .med-card::before {{
+    content: '';
+    position: absolute;
+    top: -50%;
+    left: -50%;
+    width: 200%;
+    height: 200%;
+    background: radial-gradient(circle, rgba(255,255,255,0.2) 0%, transparent 70%);
+    opacity: 0;
+    transition: opacity 0.4s ease;
+  }}
+  
+  .med-card:hover::before {{
+    opacity: 1;
+  }}
+  
+  .med-card:hover {{
+    box-shadow: 0 5px 18px rgba(0, 0, 0, 0.2);
+    transform: translateY(-3px);
+  }}
+  
+  .med-card-taken {{
+    background: linear-gradient(135deg, #E8F5E9 0%, #C8E6C9 100%);
+    border: 2.5px solid #66BB6A;
+    box-shadow: 0 3px 12px rgba(102, 187, 106, 0.2);
+  }}
+  
+  .med-card-taken:hover {{
+    box-shadow: 0 5px 18px rgba(102, 187, 106, 0.3);
+  }}
+  
+  .med-card-missed {{
+    background: linear-gradient(135deg, #FFEBEE 0%, #FFCDD2 100%);
+    border: 2.5px solid #EF5350;
+    box-shadow: 0 3px 12px rgba(239, 83, 80, 0.2);
+    animation: gentle-pulse-red 2.5s ease-in-out infinite;
+  }}
+  
+  @keyframes gentle-pulse-red {{
+    0%, 100% {{ box-shadow: 0 3px 12px rgba(239, 83, 80, 0.2); }}
+    50% {{ box-shadow: 0 5px 16px rgba(239, 83, 80, 0.3); }}
+  }}
+  
+  .med-card-due {{
+    background: linear-gradient(135deg, #FFFDE7 0%, #FFF9C4 100%);
+    border: 2.5px solid #FFCA28;
+    box-shadow: 0 3px 12px rgba(255, 202, 40, 0.2);
+    animation: gentle-pulse-yellow 2.5s ease-in-out infinite;
+  }}
+  
+  @keyframes gentle-pulse-yellow {{
+    0%, 100% {{ box-shadow: 0 3px 12px rgba(255, 202, 40, 0.2); }}
+    50% {{ box-shadow: 0 5px 16px rgba(255, 202, 40, 0.3); }}
+  }}
+  
+  .med-card *, .med-card-taken *, .med-card-missed *, .med-card-due * {{
+    font-size: {selected_font_size} !important;
+    color: {theme['text']} !important;
+  }}
+  
+  .element-container {{
+    animation: gentle-fade-in 0.5s ease-in;
+  }}
+  
+  @keyframes gentle-fade-in {{
+    from {{ opacity: 0; transform: translateY(8px); }}
+    to {{ opacity: 1; transform: translateY(0); }}
+  }}
+  
+  p {{
+    font-size: {selected_font_size} !important;
+    color: {theme['text']} !important;
+    line-height: 1.6 !important;
+  }}
+  
+  .stRadio label, .stSlider label {{
+    font-size: {selected_font_size} !important;
+  }}
+  
+  hr {{
+    border: none !important;
+    border-top: 2px solid {theme['primary']} !important;
+    margin: 25px 0 !important;
+  }}
+  
+  .theme-icon {{
+    font-size: 3rem;
+    text-align: center;
+    margin: 15px 0;
+    animation: float 3s ease-in-out infinite;
+  }}
+  
+  @keyframes float {{
+    0%, 100% {{ transform: translateY(0px); }}
+    50% {{ transform: translateY(-8px); }}
+  }}
+  
+  .stSlider {{
+    padding: 10px 0 !important;
+  }}
+  
+  .stSlider > div > div > div > div {{
+    background-color: {theme['primary']} !important;
+  }}
+  
+  .stSlider > div > div > div > div > div {{
+    background-color: {theme['secondary']} !important;
+  }}
+  </style>
+"""
+
+
+def minify_css(css):
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    css = re.sub(r"\s*([{};:,>])\s*", r"\1", css)
+    css = css.replace(";}", "}")
+    return css.strip()
+
+
+@lru_cache(maxsize=None)
+def compile_stylesheet(theme_name, font_size_value):
+    """Return (digest, minified css) for one theme and text size."""
+    match = re.search(r"<style>(.*)</style>", render_stylesheet(THEMES[theme_name], font_size_value), re.S)
+    css = minify_css(match.group(1))
+    digest = hashlib.sha256(css.encode("utf-8")).hexdigest()[:16]
+    return digest, css
+
+
+def stylesheet_injector(digest, css):
+    """Script that installs the stylesheet in the page head.
+
+    The style tag outlives the element that carried it, so the app only has
+    to send this again when the digest changes.
+    """
+    return f"""<script>
+    (function() {{
+      var old = document.getElementById("medtimer-theme");
+      if (old && old.dataset.digest === {json.dumps(digest)}) return;
+      var style = document.createElement("style");
+      style.id = "medtimer-theme";
+      style.dataset.digest = {json.dumps(digest)};
+      style.textContent = {json.dumps(css)};
+      if (old) old.replaceWith(style); else document.head.appendChild(style);
+    }})();
+    </script>"""
@@ -1,62 +1,37 @@
 import streamlit as st
-import pandas as pd
-from datetime import datetime, time
-import json
+from streamlit.errors import StreamlitAPIException
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from datetime import datetime, time, timedelta
+from functools import partial
+import csv
+import os
+from medcore.backup import content_hash, merge_backup, parse_backup
+from medcore.blobs import BlobStore, prescription_root
+from medcore.catalog import load_catalog
+from medcore.export import FORMATS as EXPORT_FORMATS, export_file, export_mime, export_name
+from medcore.history import COLUMNS as HISTORY_COLUMNS, has_history, iter_history, read_history, record_event, user_root
+from medcore.importer import detect_format, import_rows
+from medcore.profiling import Profiler, write_trace
+from medcore.recurrence import EVERY_HOURS, WEEKDAYS, describe, spread_times, validate_rule
+from medcore.schedule import CARD_STYLES, classify_schedule, dose_queue, dose_state, local_now
+from medcore.search import medicine_index
+from medcore.stats import status_counts
+from medcore.storage import FIELDS, new_id, open_store
+from medcore.themes import FONT_SIZES, THEMES, compile_stylesheet, stylesheet_injector
 
 st.set_page_config(page_title="MedTimer", page_icon="🐢", layout="centered", initial_sidebar_state="expanded")
 
-THEMES = {
-    "Sage Garden 🌿": {
-        "primary": "#A7C4A0",
-        "secondary": "#8A9A5B",
-        "background": "linear-gradient(to bottom, #FFFCF7 0%, #F5F0E6 50%, #DDEAF2 100%)",
-        "card_bg": "linear-gradient(135deg, #FFFFFF 0%, #F5F0E6 100%)",
-        "text": "#2C3E2F",
-        "button_gradient": "linear-gradient(135deg, #A7C4A0 0%, #8A9A5B 100%)",
-        "button_hover": "linear-gradient(135deg, #8A9A5B 0%, #6B7A46 100%)",
-        "icon": "🌿"
-    },
-    "Ocean Breeze 🌊": {
-        "primary": "#4A90A4",
-        "secondary": "#2E6F85",
-        "background": "linear-gradient(to bottom, #E0F2F7 0%, #B3E5F0 50%, #81D4E8 100%)",
-        "card_bg": "linear-gradient(135deg, #FFFFFF 0%, #E0F7FA 100%)",
-        "text": "#1B3A47",
-        "button_gradient": "linear-gradient(135deg, #4DD0E1 0%, #26C6DA 100%)",
-        "button_hover": "linear-gradient(135deg, #26C6DA 0%, #00ACC1 100%)",
-        "icon": "🌊"
-    },
-    "Sunset Warmth 🌅": {
-        "primary": "#E8956B",
-        "secondary": "#D97847",
-        "background": "linear-gradient(to bottom, #FFF8E1 0%, #FFE0B2 50%, #FFCCBC 100%)",
-        "card_bg": "linear-gradient(135deg, #FFFFFF 0%, #FFF3E0 100%)",
-        "text": "#4E2A1B",
-        "button_gradient": "linear-gradient(135deg, #FFB74D 0%, #FF9800 100%)",
-        "button_hover": "linear-gradient(135deg, #FF9800 0%, #F57C00 100%)",
-        "icon": "🌅"
-    },
-    "Lavender Dreams 💜": {
-        "primary": "#B39DDB",
-        "secondary": "#9575CD",
-        "background": "linear-gradient(to bottom, #F3E5F5 0%, #E1BEE7 50%, #CE93D8 100%)",
-        "card_bg": "linear-gradient(135deg, #FFFFFF 0%, #F3E5F5 100%)",
-        "text": "#4A148C",
-        "button_gradient": "linear-gradient(135deg, #BA68C8 0%, #AB47BC 100%)",
-        "button_hover": "linear-gradient(135deg, #AB47BC 0%, #9C27B0 100%)",
-        "icon": "💜"
-    },
-    "Spring Blossom 🌸": {
-        "primary": "#F48FB1",
-        "secondary": "#EC407A",
-        "background": "linear-gradient(to bottom, #FCE4EC 0%, #F8BBD0 50%, #F48FB1 100%)",
-        "card_bg": "linear-gradient(135deg, #FFFFFF 0%, #FCE4EC 100%)",
-        "text": "#880E4F",
-        "button_gradient": "linear-gradient(135deg, #F48FB1 0%, #EC407A 100%)",
-        "button_hover": "linear-gradient(135deg, #EC407A 0%, #E91E63 100%)",
-        "icon": "🌸"
-    }
-}
+TRACE_FILE = os.environ.get("MEDTIMER_TRACE")
+PROFILE_RUNS = 10
+
+def drawn_elements():
+    # Elements placed so far in the page's root containers (main, sidebar);
+    # anything nested in a column or expander counts with its container.
+    ctx = get_script_run_ctx()
+    return sum(cursor.index for cursor in ctx.cursors.values()) if ctx is not None else 0
+
+profiler = Profiler(enabled=bool(st.session_state.get("profiling") or TRACE_FILE), elements=drawn_elements)
+profiler.mark("sidebar")
 
 st.sidebar.markdown("# ⚙ Settings")
 st.sidebar.markdown("---")
@@ -73,7 +48,7 @@ theme = THEMES[selected_theme_name]
 st.sidebar.markdown("### 📝 Text Size")
 font_size_value = st.sidebar.select_slider(
     "Adjust text size:",
-    options=[18, 20, 22, 24],
+    options=FONT_SIZES,
     value=20,
     key="font_size_selector",
     label_visibility="collapsed"
@@ -86,6 +61,17 @@ app_mode = st.sidebar.radio(
     key="app_mode"
 )
 
+st.sidebar.markdown("### 👤 Profile")
+profile_name = st.sidebar.text_input(
+    "Profile name",
+    value="default",
+    key="profile_name",
+    label_visibility="collapsed"
+).strip() or "default"
+
+st.sidebar.markdown("### ⏱ Performance")
+st.sidebar.toggle("Profile reruns", key="profiling")
+
 st.sidebar.markdown("---")
 st.sidebar.markdown("### 💡 Tips")
 if "Guided" in app_mode:
@@ -93,545 +79,26 @@ if "Guided" in app_mode:
 else:
     st.sidebar.info("⚡ Quickly add medicines if you're already familiar with the app.")
 
-selected_font_size = f"{font_size_value}px"
-
-base_size = int(selected_font_size.replace("px", ""))
-heading_size = f"{base_size + 8}px"
-subheading_size = f"{base_size + 4}px"
-label_size = f"{base_size + 2}px"
-
-st.markdown(f"""
-  <style>
-  @import url('https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700&display=swap');
-  
-  * {{
-    font-family: 'Inter', -apple-system, BlinkMacSystemFont, 'Segoe UI', sans-serif !important;
-  }}
-  
-  body, .stApp, [data-testid="stAppViewContainer"], [data-testid="stHeader"] {{
-    background: {theme['background']} !important;
-  }}
-  
-  [data-testid="stSidebar"] {{
-    background: {theme['card_bg']} !important;
-    border-right: 3px solid {theme['primary']} !important;
-    min-width: 320px !important;
-    max-width: 320px !important;
-  }}
-  
-  [data-testid="stSidebar"] * {{
-    color: {theme['text']} !important;
-  }}
-  
-  [data-testid="stSidebar"] > div:first-child {{
-    padding: 2rem 1.5rem !important;
-  }}
-  
-  input[type="text"] {{
-    -webkit-autocomplete: off !important;
-    autocomplete: off !important;
-  }}
-  
-  input, textarea,
-  .stTextInput input, .stTextArea textarea, 
-  .stTimeInput input, .stNumberInput input
-  {{
-    background: {theme['card_bg']} !important;
-    color: #000000 !important;
-    border-radius: 10px !important;
-    border: 2.5px solid {theme['primary']} !important;
-    font-weight: 500 !important;
-    font-size: {selected_font_size} !important;
-    padding: 14px 18px !important;
-    height: auto !important;
-    min-height: 50px !important;
-    line-height: 1.5 !important;
-    box-shadow: 0 2px 8px rgba(0, 0, 0, 0.1) !important;
-    transition: all 0.3s ease !important;
-    width: 100% !important;
-    box-sizing: border-box !important;
-  }}
-  
-  input::placeholder, textarea::placeholder {{
-    color: #666666 !important;
-    opacity: 0.8 !important;
-    font-weight: 400 !important;
-    font-size: {selected_font_size} !important;
-  }}
-  
-  input:focus, textarea:focus {{
-    border-color: {theme['secondary']} !important;
-    box-shadow: 0 3px 12px rgba(0, 0, 0, 0.15), 0 0 0 3px rgba(0, 0, 0, 0.05) !important;
-    transform: translateY(-1px) !important;
-    outline: none !important;
-  }}
-  
-  /* DROPDOWN FIXES */
-  .stSelectbox > div {{
-    width: 100% !important;
-    max-width: 100% !important;
-  }}
-  
-  .stSelectbox > div > div {{
-    background: transparent !important;
-    border: none !important;
-    padding: 0 !important;
-  }}
-  
-  /* Main dropdown container with solid borders on ALL sides */
-  div[data-baseweb="select"] {{
-    background: {theme['card_bg']} !important;
-    border-radius: 10px !important;
-    border: 2.5px solid {theme['primary']} !important;
-    padding: 0 !important;
-    box-shadow: 0 2px 8px rgba(0, 0, 0, 0.1) !important;
-    transition: all 0.3s ease !important;
-  }}
-  
-  div[data-baseweb="select"]:hover {{
-    box-shadow: 0 3px 12px rgba(0, 0, 0, 0.15) !important;
-    border-color: {theme['secondary']} !important;
-  }}
-  
-  /* Inner dropdown padding */
-  div[data-baseweb="select"] > div {{
-    background: transparent !important;
-    border: none !important;
-    padding: 14px 18px !important;
-    min-height: 50px !important;
-    width: 100% !important;
-  }}
-  
-  div[data-baseweb="select"] > div > div {{
-    background: transparent !important;
-    border: none !important;
-    padding: 0 !important;
-    width: 100% !important;
-  }}
-  
-  /* NUCLEAR OPTION - Force all dropdown text to be BLACK and VISIBLE */
-  div[data-baseweb="select"],
-  div[data-baseweb="select"] *,
-  div[data-baseweb="select"] span,
-  div[data-baseweb="select"] div,
-  div[data-baseweb="select"] input,
-  div[data-baseweb="select"] [role="button"],
-  div[data-baseweb="select"] [role="button"] *,
-  div[data-baseweb="select"] [data-baseweb="select-value"],
-  div[data-baseweb="select"] [data-baseweb="select-value"] * {{
-    color: #000000 !important;
-    -webkit-text-fill-color: #000000 !important;
-    font-weight: 600 !important;
-    opacity: 1 !important;
-    font-size: {selected_font_size} !important;
-  }}
-  
-  /* Dropdown arrow */
-  div[data-baseweb="select"] svg {{
-    color: {theme['secondary']} !important;
-    fill: {theme['secondary']} !important;
-    width: 20px !important;
-    height: 20px !important;
-  }}
-  
-  .stTimeInput input {{
-    height: auto !important;
-    min-height: 50px !important;
-    padding: 14px 18px !important;
-    font-size: {selected_font_size} !important;
-  }}
-  
-  /* Dropdown menu items */
-  ul[role="listbox"] {{
-    background: {theme['card_bg']} !important;
-    max-height: 320px !important;
-    min-width: 100% !important;
-    border-radius: 10px !important;
-    border: 2.5px solid {theme['primary']} !important;
-    box-shadow: 0 8px 24px rgba(0, 0, 0, 0.2) !important;
-    padding: 8px !important;
-  }}
-  
-  ul[role="listbox"] li {{
-    background: transparent !important;
-    color: #000000 !important;
-    padding: 12px 16px !important;
-    font-size: {selected_font_size} !important;
-    font-weight: 500 !important;
-    border-radius: 8px !important;
-    margin: 4px 0 !important;
-    transition: all 0.25s ease !important;
-  }}
-  
-  ul[role="listbox"] li:hover {{
-    background: {theme['button_gradient']} !important;
-    color: #FFFFFF !important;
-    transform: translateX(4px) !important;
-    box-shadow: 0 2px 8px rgba(0, 0, 0, 0.15) !important;
-  }}
-  
-  label, .stSelectbox label, .stTextInput label, 
-  .stTextArea label, .stNumberInput label, 
-  .stTimeInput label, .stFileUploader label {{
-    color: {theme['text']} !important;
-    font-weight: 600 !important;
-    font-size: {label_size} !important;
-    margin-bottom: 10px !important;
-    display: block !important;
-    letter-spacing: 0.3px !important;
-  }}
-  
-  div.stButton button, .stDownloadButton button {{
-    background: {theme['button_gradient']} !important;
-    color: #FFFFFF !important;
-    border-radius: 10px !important;
-    border: none !important;
-    font-weight: 600 !important;
-    font-size: {selected_font_size} !important;
-    padding: 12px 24px !important;
-    transition: all 0.35s ease !important;
-    width: 100% !important;
-    min-height: 48px !important;
-    max-height: 48px !important;
-    box-shadow: 0 3px 10px rgba(0, 0, 0, 0.15) !important;
-    letter-spacing: 0.5px !important;
-    position: relative !important;
-    overflow: hidden !important;
-    cursor: pointer !important;
-  }}
-  
-  div.stButton button::after {{
-    content: '' !important;
-    position: absolute !important;
-    top: 50% !important;
-    left: 50% !important;
-    width: 0 !important;
-    height: 0 !important;
-    border-radius: 50% !important;
-    background: rgba(255, 255, 255, 0.4) !important;
-    transform: translate(-50%, -50%) !important;
-    transition: width 0.5s ease, height 0.5s ease !important;
-  }}
-  
-  div.stButton button:hover {{
-    background: {theme['button_hover']} !important;
-    transform: translateY(-2px) !important;
-    box-shadow: 0 5px 15px rgba(0, 0, 0, 0.25) !important;
-  }}
-  
-  div.stButton button:active::after {{
-    width: 300px !important;
-    height: 300px !important;
-  }}
-  
-  div.stButton button:active {{
-    transform: translateY(0px) scale(0.98) !important;
-  }}
-  
-  h1, h2, h3, h4, h5, h6 {{
-    color: {theme['text']} !important;
-    font-weight: 700 !important;
-    letter-spacing: 0.5px !important;
-    line-height: 1.4 !important;
-  }}
-  
-  h1 {{
-    font-size: {heading_size} !important;
-    margin-bottom: 0.5rem !important;
-  }}
-  
-  h2 {{
-    font-size: {subheading_size} !important;
-  }}
-  
-  h3 {{
-    font-size: {label_size} !important;
-  }}
-  
-  .step-indicator {{
-    text-align: center;
-    font-size: {label_size};
-    font-weight: 600;
-    color: #FFFFFF;
-    background: {theme['button_gradient']};
-    padding: 16px 24px;
-    border-radius: 10px;
-    margin: 20px auto;
-    max-width: 600px;
-    box-shadow: 0 3px 12px rgba(0, 0, 0, 0.2);
-    border: 2px solid {theme['secondary']};
-    animation: gentle-glow 3s ease-in-out infinite alternate;
-    letter-spacing: 0.8px;
-  }}
-  
-  @keyframes gentle-glow {{
-    from {{
-      box-shadow: 0 3px 12px rgba(0, 0, 0, 0.2);
-    }}
-    to {{
-      box-shadow: 0 5px 18px rgba(0, 0, 0, 0.3);
-    }}
-  }}
-  
-  .stAlert, div[data-baseweb="notification"] {{
-    background: {theme['card_bg']} !important;
-    color: {theme['text']} !important;
-    border: 2px solid {theme['primary']} !important;
-    border-radius: 10px !important;
-    padding: 16px 20px !important;
-    box-shadow: 0 2px 10px rgba(0, 0, 0, 0.1) !important;
-    font-size: {selected_font_size} !important;
-  }}
-  
-  .element-container div[data-testid="stMarkdownContainer"] p {{
-    color: {theme['text']} !important;
-    font-size: {selected_font_size} !important;
-  }}
-  
-  .stFileUploader, section[data-testid="stFileUploader"],
-  [data-testid="stFileUploader"] > div,
-  [data-testid="stFileUploader"] section {{
-    background: {theme['card_bg']} !important;
-    border: 2.5px solid {theme['primary']} !important;
-    border-radius: 10px !important;
-    padding: 20px !important;
-    box-shadow: 0 2px 10px rgba(0, 0, 0, 0.1) !important;
-  }}
-  
-  section[data-testid="stFileUploadDropzone"],
-  section[data-testid="stFileUploadDropzone"] > div,
-  section[data-testid="stFileUploadDropzone"] > div > div,
-  [data-testid="stFileUploadDropzone"] div {{
-    background: {theme['card_bg']} !important;
-    border-radius: 8px !important;
-    border: 2.5px dashed {theme['primary']} !important;
-    color: {theme['text']} !important;
-    padding: 20px !important;
-  }}
-  
-  section[data-testid="stFileUploadDropzone"] small,
-  section[data-testid="stFileUploadDropzone"] span,
-  [data-testid="stFileUploadDropzone"] small,
-  [data-testid="stFileUploadDropzone"] span,
-  [data-testid="stFileUploadDropzone"] p,
-  section[data-testid="stFileUploadDropzone"] p,
-  section[data-testid="stFileUploadDropzone"] div,
-  [data-testid="stFileUploadDropzone"] div {{
-    color: #000000 !important;
-    font-weight: 500 !important;
-    font-size: {selected_font_size} !important;
-  }}
-  
-  section[data-testid="stFileUploadDropzone"] button,
-  [data-testid="stFileUploadDropzone"] button {{
-    background: {theme['button_gradient']} !important;
-    color: #FFFFFF !important;
-    border: none !important;
-    border-radius: 8px !important;
-    padding: 10px 20px !important;
-    font-weight: 600 !important;
-    font-size: {selected_font_size} !important;
-    transition: all 0.3s ease !important;
-  }}
-  
-  section[data-testid="stFileUploadDropzone"] button:hover {{
-    transform: scale(1.05) !important;
-    box-shadow: 0 3px 12px rgba(0, 0, 0, 0.2) !important;
-  }}
-  
-  .stTextInput > div, .stSelectbox > div, .stTimeInput > div {{
-    border: none !important;
-    background: transparent !important;
-    border-bottom: none !important;
-  }}
-  
-  .med-card {{
-    background: {theme['card_bg']};
-    border: 2.5px solid {theme['primary']};
-    border-radius: 12px;
-    padding: 22px;
-    margin: 16px 0;
-    box-shadow: 0 3px 12px rgba(0, 0, 0, 0.12);
-    transition: all 0.3s ease;
-    position: relative;
-    overflow: hidden;
-  }}
-  
-  .med-card::before {{
-    content: '';
-    position: absolute;
-    top: -50%;
-    left: -50%;
-    width: 200%;
-    height: 200%;
-    background: radial-gradient(circle, rgba(255,255,255,0.2) 0%, transparent 70%);
-    opacity: 0;
-    transition: opacity 0.4s ease;
-  }}
-  
-  .med-card:hover::before {{
-    opacity: 1;
-  }}
-  
-  .med-card:hover {{
-    box-shadow: 0 5px 18px rgba(0, 0, 0, 0.2);
-    transform: translateY(-3px);
-  }}
-  
-  .med-card-taken {{
-    background: linear-gradient(135deg, #E8F5E9 0%, #C8E6C9 100%);
-    border: 2.5px solid #66BB6A;
-    box-shadow: 0 3px 12px rgba(102, 187, 106, 0.2);
-  }}
-  
-  .med-card-taken:hover {{
-    box-shadow: 0 5px 18px rgba(102, 187, 106, 0.3);
-  }}
-  
-  .med-card-missed {{
-    background: linear-gradient(135deg, #FFEBEE 0%, #FFCDD2 100%);
-    border: 2.5px solid #EF5350;
-    box-shadow: 0 3px 12px rgba(239, 83, 80, 0.2);
-    animation: gentle-pulse-red 2.5s ease-in-out infinite;
-  }}
-  
-  @keyframes gentle-pulse-red {{
-    0%, 100% {{ box-shadow: 0 3px 12px rgba(239, 83, 80, 0.2); }}
-    50% {{ box-shadow: 0 5px 16px rgba(239, 83, 80, 0.3); }}
-  }}
-  
-  .med-card-due {{
-    background: linear-gradient(135deg, #FFFDE7 0%, #FFF9C4 100%);
-    border: 2.5px solid #FFCA28;
-    box-shadow: 0 3px 12px rgba(255, 202, 40, 0.2);
-    animation: gentle-pulse-yellow 2.5s ease-in-out infinite;
-  }}
-  
-  @keyframes gentle-pulse-yellow {{
-    0%, 100% {{ box-shadow: 0 3px 12px rgba(255, 202, 40, 0.2); }}
-    50% {{ box-shadow: 0 5px 16px rgba(255, 202, 40, 0.3); }}
-  }}
-  
-  .med-card *, .med-card-taken *, .med-card-missed *, .med-card-due * {{
-    font-size: {selected_font_size} !important;
-    color: {theme['text']} !important;
-  }}
-  
-  .element-container {{
-    animation: gentle-fade-in 0.5s ease-in;
-  }}
-  
-  @keyframes gentle-fade-in {{
-    from {{ opacity: 0; transform: translateY(8px); }}
-    to {{ opacity: 1; transform: translateY(0); }}
-  }}
-  
-  p {{
-    font-size: {selected_font_size} !important;
-    color: {theme['text']} !important;
-    line-height: 1.6 !important;
-  }}
-  
-  .stRadio label, .stSlider label {{
-    font-size: {selected_font_size} !important;
-  }}
-  
-  hr {{
-    border: none !important;
-    border-top: 2px solid {theme['primary']} !important;
-    margin: 25px 0 !important;
-  }}
-  
-  .theme-icon {{
-    font-size: 3rem;
-    text-align: center;
-    margin: 15px 0;
-    animation: float 3s ease-in-out infinite;
-  }}
-  
-  @keyframes float {{
-    0%, 100% {{ transform: translateY(0px); }}
-    50% {{ transform: translateY(-8px); }}
-  }}
-  
-  .stSlider {{
-    padding: 10px 0 !important;
-  }}
-  
-  .stSlider > div > div > div > div {{
-    background-color: {theme['primary']} !important;
-  }}
-  
-  .stSlider > div > div > div > div > div {{
-    background-color: {theme['secondary']} !important;
-  }}
-  </style>
-""", unsafe_allow_html=True)
-
-COUNTRIES = {
-    "India": {"timezones": ["Asia/Kolkata"], "states": ["All India"]},
-    "United States": {"timezones": ["America/New_York", "America/Chicago", "America/Denver", "America/Los_Angeles"], 
-                      "states": ["Eastern (NY, FL)", "Central (TX, IL)", "Mountain (CO, AZ)", "Pacific (CA, WA)"]},
-    "United Kingdom": {"timezones": ["Europe/London"], "states": ["All UK"]},
-    "Australia": {"timezones": ["Australia/Sydney", "Australia/Melbourne", "Australia/Brisbane", "Australia/Perth"],
-                  "states": ["New South Wales", "Victoria", "Queensland", "Western Australia"]},
-    "Canada": {"timezones": ["America/Toronto", "America/Vancouver", "America/Edmonton"],
-               "states": ["Ontario/Quebec", "British Columbia", "Alberta"]},
-    "Germany": {"timezones": ["Europe/Berlin"], "states": ["All Germany"]},
-    "France": {"timezones": ["Europe/Paris"], "states": ["All France"]},
-    "Japan": {"timezones": ["Asia/Tokyo"], "states": ["All Japan"]},
-    "China": {"timezones": ["Asia/Shanghai"], "states": ["All China"]},
-    "Brazil": {"timezones": ["America/Sao_Paulo", "America/Manaus"], "states": ["Southeast", "North"]},
-    "Spain": {"timezones": ["Europe/Madrid"], "states": ["All Spain"]},
-    "Italy": {"timezones": ["Europe/Rome"], "states": ["All Italy"]},
-}
-
-DISEASES = {
-    "India": {
-        "Hypertension": ["Amlodipine 5mg", "Telmisartan 40mg", "Atenolol 50mg"],
-        "Diabetes Type 2": ["Metformin 500mg", "Glimepiride 1mg", "Sitagliptin 50mg"],
-        "Hypothyroidism": ["Thyroxine 50mcg", "Levothyroxine 100mcg"],
-        "Asthma": ["Salbutamol Inhaler", "Budesonide", "Montelukast"],
-        "COPD": ["Tiotropium Inhaler", "Formoterol", "N-Acetylcysteine"],
-        "Heart Disease": ["Aspirin 75mg", "Atorvastatin 10mg", "Metoprolol 25mg"],
-        "Arthritis": ["Diclofenac 50mg", "Paracetamol 500mg", "Hydroxychloroquine"],
-        "Depression": ["Escitalopram 10mg", "Sertraline 50mg"],
-        "Anxiety": ["Alprazolam 0.5mg", "Propranolol 20mg"],
-        "Migraine": ["Sumatriptan 50mg", "Propranolol 40mg", "Topiramate 25mg"]
-    },
-    "United States": {
-        "Hypertension": ["Lisinopril 10mg", "Amlodipine 5mg", "Losartan 50mg"],
-        "Diabetes Type 2": ["Metformin 500mg", "Insulin Glargine", "Sitagliptin 100mg"],
-        "Hypothyroidism": ["Levothyroxine 50mcg", "Synthroid 75mcg"],
-        "Asthma": ["Albuterol Inhaler", "Fluticasone 250mcg", "Montelukast 10mg"],
-        "COPD": ["Tiotropium Respimat", "Albuterol", "Prednisone"],
-        "Heart Disease": ["Aspirin 81mg", "Atorvastatin 20mg", "Metoprolol 50mg"],
-        "Arthritis": ["Ibuprofen 400mg", "Naproxen 500mg", "Methotrexate"],
-        "Depression": ["Sertraline 50mg", "Fluoxetine 20mg", "Bupropion XL"],
-        "Anxiety": ["Buspirone 10mg", "Hydroxyzine 25mg"],
-        "Migraine": ["Sumatriptan 100mg", "Rizatriptan 10mg", "Topiramate 50mg"]
-    }
-}
-
-for country in ["United Kingdom", "Germany", "France", "Spain", "Italy"]:
-    DISEASES[country] = DISEASES["United States"].copy()
-for country in ["Australia", "Canada"]:
-    DISEASES[country] = DISEASES["United States"].copy()
-for country in ["Japan", "China", "Brazil"]:
-    DISEASES[country] = DISEASES["India"].copy()
-
-def load_data():
+profiler.mark("stylesheet")
+stylesheet_digest, stylesheet = compile_stylesheet(selected_theme_name, font_size_value)
+if st.session_state.get("stylesheet_digest") != stylesheet_digest:
     try:
-        with open("med_data.json", "r") as f:
-            return json.load(f)
-    except:
-        return []
+        st.html(stylesheet_injector(stylesheet_digest, stylesheet), unsafe_allow_javascript=True)
+        st.session_state.stylesheet_digest = stylesheet_digest
+    except TypeError:
+        # Older Streamlit without script support in st.html: inline it every rerun.
+        st.markdown(f"<style>{stylesheet}</style>", unsafe_allow_html=True)
 
-def save_data(data):
-    with open("med_data.json", "w") as f:
-        json.dump(data, f, indent=4)
+profiler.mark("catalog")
+catalog = load_catalog()
+COUNTRIES = catalog.countries
+DISEASES = catalog.conditions
+medicine_search = medicine_index(catalog.medicines())
 
-medicine_data = load_data()
+profiler.mark("store")
+store = open_store(user=profile_name)
+history_root = user_root(profile_name)
+prescriptions = BlobStore(prescription_root(profile_name))
 
 if "step" not in st.session_state:
     st.session_state.step = 1
@@ -643,21 +110,233 @@ if "med_status" not in st.session_state:
     st.session_state.med_status = {}
 if "show_balloons" not in st.session_state:
     st.session_state.show_balloons = False
+if "quick_page" not in st.session_state:
+    st.session_state.quick_page = 0
+if "restored_backups" not in st.session_state:
+    st.session_state.restored_backups = set()
 
-def get_med_status(med_name, med_time):
-    current_time = datetime.now().time()
-    med_time_obj = datetime.strptime(med_time, "%H:%M").time()
-    
-    if med_name in st.session_state.med_status:
-        return st.session_state.med_status[med_name]
-    
-    if current_time > med_time_obj:
-        return "missed"
-    elif current_time.hour == med_time_obj.hour and abs(current_time.minute - med_time_obj.minute) <= 30:
-        return "due"
+PAGE_SIZES = [10, 25, 50, 100]
+WINDOW_HOURS = 3
+
+def mark_med_taken(med_name):
+    record_event(f"guided:{med_name}", med_name, "Taken", previous=st.session_state.med_status.get(med_name),
+                 source="guided", root=history_root)
+    st.session_state.med_status[med_name] = "taken"
+    st.session_state.show_balloons = True
+
+def set_quick_status(med_id, status, shown_status):
+    # Only applies if the dose still has the status this session showed, so a
+    # change made meanwhile in another session is reported, not overwritten.
+    med = store.get(med_id)
+    conflicts = store.update(med_id, expect={"status": shown_status}, status=status)
+    if conflicts:
+        if med is None or conflicts.get("status") is None:
+            st.session_state[f"conflict_{med_id}"] = "⚠ This medicine was deleted in another session."
+        else:
+            st.session_state[f"conflict_{med_id}"] = (
+                f"⚠ {med['medicine']} was already marked {conflicts['status']} in another session.")
+    elif med is not None:
+        record_event(med_id, med["medicine"], status, previous=shown_status, root=history_root)
+    st.session_state.stats_changed = True
+    if status == "Taken":
+        st.session_state.show_balloons = True
+
+def lazy_download(label, make_file, file_name, mime, key):
+    # The export is only built when the button is clicked. Streamlit versions
+    # without deferred downloads get a "Prepare" click first instead.
+    try:
+        st.download_button(label=label, data=make_file, mime=mime, file_name=file_name,
+                           use_container_width=True, key=key)
+    except StreamlitAPIException:
+        if st.button(f"📦 Prepare {label[2:]}", use_container_width=True, key=f"prepare_{key}"):
+            st.download_button(label=label, data=make_file(), mime=mime, file_name=file_name,
+                               use_container_width=True, key=f"{key}_ready")
+
+def export_options(key):
+    col1, col2 = st.columns([2, 1])
+    with col1:
+        export_format = st.selectbox("Format", list(EXPORT_FORMATS), key=f"{key}_format")
+    with col2:
+        st.write("")
+        st.write("")
+        compress = st.checkbox("gzip", key=f"{key}_gzip")
+    return EXPORT_FORMATS[export_format][0], compress
+
+@st.fragment
+def prescription_gallery():
+    items = prescriptions.items()
+    if not items:
+        return
+    prescriptions.request_previews(items)
+    st.markdown("*Your Prescriptions*")
+    for row in range(0, len(items), 3):
+        for col, meta in zip(st.columns(3), items[row:row + 3]):
+            digest = meta["digest"]
+            with col:
+                if meta.get("thumbnail"):
+                    st.image(prescriptions.thumbnail_path(digest))
+                else:
+                    icon = "📄" if meta["mime"] == "application/pdf" else "🖼"
+                    st.markdown(f"<div style='font-size:3rem; text-align:center;'>{icon}</div>", unsafe_allow_html=True)
+                details = f"{meta['size'] / 1024:,.0f} KB"
+                if meta.get("pages") and meta["mime"] == "application/pdf":
+                    details += f" · {meta['pages']} pages"
+                if meta.get("preview") == "pending":
+                    details += " · ⏳ preview on its way"
+                st.caption(f"{meta['name']} · {details}")
+                lazy_download("⬇ Download", partial(prescriptions.read, digest), meta["name"],
+                              meta["mime"] or None, key=f"rx_download_{digest[:16]}")
+                st.button("🗑 Delete", use_container_width=True, key=f"rx_delete_{digest[:16]}",
+                          on_click=prescriptions.delete, args=(digest,))
+    if any(meta.get("preview") == "pending" for meta in items):
+        st.button("🔄 Refresh previews", key="rx_refresh")
+
+def set_dose_time(i):
+    # A rule spread from the old time moves with it; hand-picked times stay.
+    med = st.session_state.meds[i]
+    new_time = st.session_state[f"time_{i}"].strftime("%H:%M")
+    times = (med.get("rule") or {}).get("times")
+    if times and len(times) > 1 and times == spread_times(med["time"], len(times)):
+        med["rule"] = dict(med["rule"], times=spread_times(new_time, len(times)))
+    med["time"] = new_time
+
+def set_doses(i):
+    # Only the dose times change; weekdays, start and end are kept.
+    med = st.session_state.meds[i]
+    doses = st.session_state[f"doses_{i}"]
+    rule = {key: value for key, value in (med.get("rule") or {}).items() if key != "times"}
+    if doses > 1 or rule:
+        med["rule"] = dict(rule, times=spread_times(med["time"], doses))
     else:
-        return "upcoming"
+        med.pop("rule", None)
+
+# Cards are fragments: a status button reruns only its own card, and the
+# card redraws the statistics placeholder instead of rerunning the page.
+@st.fragment
+def dose_card(i, med, time_state):
+    state = dose_state(st.session_state.med_status.get(med['name']), time_state)
+    card_class, status_icon = CARD_STYLES.get(state, CARD_STYLES["upcoming"])
+    button_disabled = state == "taken"
+    st.markdown(f"<div class='{card_class}'>", unsafe_allow_html=True)
+    col1, col2, col3, col4 = st.columns([3, 2, 2, 2])
+    with col1:
+        st.markdown(f"{med['name']}")
+    with col2:
+        st.markdown(f"🕐 {med['time']}")
+        if med.get("rule"):
+            st.caption(f"🔁 {describe(med['rule'])}")
+    with col3:
+        st.markdown(f"{status_icon}")
+    with col4:
+        if not button_disabled:
+            st.button(f"✅ Taken", key=f"taken_{med['name']}_{i}", on_click=mark_med_taken, args=(med['name'],))
+    st.markdown("</div>", unsafe_allow_html=True)
+    st.write("")
+    if st.session_state.show_balloons:
+        st.balloons()
+        st.session_state.show_balloons = False
+
+@st.fragment
+def quick_card(med_id, time_state, stats_slot):
+    med = store.get(med_id)
+    if med is None:
+        return
+    card_class, status_icon = CARD_STYLES.get(dose_state(med["status"], time_state), CARD_STYLES["scheduled"])
+    conflict = st.session_state.pop(f"conflict_{med_id}", None)
+    if conflict:
+        st.warning(conflict)
+    st.markdown(f"<div class='{card_class}'>", unsafe_allow_html=True)
+    col1, col2, col3 = st.columns([3, 2, 2])
+    with col1:
+        st.markdown(f"💊 {med['medicine']}")
+        st.markdown(f"{med['disease']}")
+    with col2:
+        st.markdown(f"🕐 *{med['time']}*")
+        if med.get("rule"):
+            st.markdown(f"🔁 {describe(med['rule'])}")
+        if med['notes']:
+            st.markdown(f"📝 {med['notes']}")
+    with col3:
+        st.markdown(f"{status_icon}")
+        st.markdown(f"📍 {med['state']}")
+    st.write("")
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        if med["status"] != "Taken":
+            st.button("✅ Mark Taken", key=f"taken_quick_{med['id']}", use_container_width=True,
+                      on_click=set_quick_status, args=(med["id"], "Taken", med["status"]))
+    with col2:
+        if med["status"] != "Missed":
+            st.button("🟥 Mark Missed", key=f"missed_quick_{med['id']}", use_container_width=True,
+                      on_click=set_quick_status, args=(med["id"], "Missed", med["status"]))
+    with col3:
+        if med["status"] != "Due":
+            st.button("🔄 Reset", key=f"reset_quick_{med['id']}", use_container_width=True,
+                      on_click=set_quick_status, args=(med["id"], "Due", med["status"]))
+    with col4:
+        if st.button("🗑 Delete", key=f"delete_quick_{med['id']}", use_container_width=True):
+            store.delete(med["id"])
+            st.rerun()
+    st.markdown("</div>", unsafe_allow_html=True)
+    st.write("")
+    if st.session_state.pop("stats_changed", False):
+        render_stats(stats_slot, store.stats())
+    if st.session_state.show_balloons:
+        st.balloons()
+        st.session_state.show_balloons = False
+
+def render_stats(slot, stats):
+    counts = status_counts(stats)
+    total_meds = counts["total"]
+    taken_count = counts["Taken"]
+    missed_count = counts["Missed"]
+    due_count = counts["Due"]
+    stats_container = slot.container()
+    col1, col2, col3, col4 = stats_container.columns(4)
+    with col1:
+        st.markdown(f"""
+            <div style='background: {theme['card_bg']}; border: 2.5px solid {theme['primary']}; 
+            border-radius: 12px; padding: 20px; text-align: center;'>
+                <h2 style='margin: 0;'>{total_meds}</h2>
+                <p style='margin: 5px 0 0 0;'>Total</p>
+            </div>
+        """, unsafe_allow_html=True)
+    with col2:
+        st.markdown(f"""
+            <div style='background: linear-gradient(135deg, #E8F5E9 0%, #C8E6C9 100%); 
+            border: 2.5px solid #66BB6A; border-radius: 12px; padding: 20px; text-align: center;'>
+                <h2 style='margin: 0; color: #2E7D32;'>{taken_count}</h2>
+                <p style='margin: 5px 0 0 0; color: #2E7D32;'>Taken</p>
+            </div>
+        """, unsafe_allow_html=True)
+    with col3:
+        st.markdown(f"""
+            <div style='background: linear-gradient(135deg, #FFEBEE 0%, #FFCDD2 100%); 
+            border: 2.5px solid #EF5350; border-radius: 12px; padding: 20px; text-align: center;'>
+                <h2 style='margin: 0; color: #C62828;'>{missed_count}</h2>
+                <p style='margin: 5px 0 0 0; color: #C62828;'>Missed</p>
+            </div>
+        """, unsafe_allow_html=True)
+    with col4:
+        st.markdown(f"""
+            <div style='background: linear-gradient(135deg, #FFFDE7 0%, #FFF9C4 100%); 
+            border: 2.5px solid #FFCA28; border-radius: 12px; padding: 20px; text-align: center;'>
+                <h2 style='margin: 0; color: #F57F17;'>{due_count}</h2>
+                <p style='margin: 5px 0 0 0; color: #F57F17;'>Due</p>
+            </div>
+        """, unsafe_allow_html=True)
+    with stats_container.expander("📈 Breakdown"):
+        col1, col2, col3 = st.columns(3)
+        for col, title, dimension in [(col1, "By Condition", "disease"), (col2, "By Region", "state"),
+                                      (col3, "By Hour", "hour")]:
+            with col:
+                st.markdown(f"*{title}*")
+                for key, count in sorted(stats[dimension].items()):
+                    label = f"{key}:00" if dimension == "hour" else key
+                    st.markdown(f"{label}: {count}")
+
 
+profiler.mark("header")
 if st.session_state.show_balloons:
     st.balloons()
     st.session_state.show_balloons = False
@@ -666,11 +345,14 @@ st.markdown(f"<div class='theme-icon'>{theme['icon']}</div>", unsafe_allow_html=
 st.markdown("<h1 style='text-align:center;'>🐢 MedTimer</h1>", unsafe_allow_html=True)
 st.markdown(f"<p style='text-align:center; font-size:1.2rem; font-weight:500;'>Slow & Steady Wins Your Health Race</p>", unsafe_allow_html=True)
 st.write("")
+if "restore_notice" in st.session_state:
+    st.success(st.session_state.pop("restore_notice"))
 
 if "Guided" in app_mode:
     
     step_names = ["Name", "Location", "Condition", "Medicines", "Schedule", "Dashboard"]
     current_step = st.session_state.step
+    profiler.mark(f"guided_step_{current_step}")
     st.markdown(f"<div class='step-indicator'>Step {current_step} of 6: {step_names[current_step-1]}</div>", unsafe_allow_html=True)
     st.write("")
 
@@ -775,6 +457,13 @@ if "Guided" in app_mode:
         col1, col2 = st.columns([4, 1])
         with col1:
             custom_name = st.text_input("Medicine Name:", key="custom_med", placeholder="Enter medicine name")
+            typed_name = custom_name.strip()
+            if typed_name:
+                # What was typed comes first and is the default; catalog
+                # matches (maybe another strength) must be picked on purpose.
+                matches = [typed_name] + [name for name in medicine_search.search(typed_name, k=8) if name != typed_name]
+                custom_name = st.selectbox("Matching medicines:", matches, key="custom_med_match",
+                                           format_func=lambda name: f"{name} (as typed)" if name == typed_name else name)
         with col2:
             st.write("")
             st.write("")
@@ -799,14 +488,24 @@ if "Guided" in app_mode:
         st.info("🐢 Set the time you need to take each medicine")
         st.write("")
         for i, med in enumerate(st.session_state.meds):
-            col1, col2 = st.columns([3, 2])
+            col1, col2, col3 = st.columns([3, 2, 2])
             with col1:
                 st.markdown(f"### {med['name']}")
             with col2:
-                time_val = st.time_input(f"Time for {med['name']}", 
-                                        datetime.strptime(med["time"], "%H:%M").time(), 
-                                        key=f"time_{i}", label_visibility="collapsed")
-                st.session_state.meds[i]["time"] = time_val.strftime("%H:%M")
+                st.time_input(f"Time for {med['name']}", datetime.strptime(med["time"], "%H:%M").time(),
+                              key=f"time_{i}", label_visibility="collapsed", on_change=set_dose_time, args=(i,))
+            with col3:
+                rule = med.get("rule") or {}
+                if rule and not rule.get("times"):
+                    # Every few hours or a tapering course: set up in Quick Add or restored.
+                    st.caption(f"🔁 {describe(rule)}")
+                else:
+                    current_doses = min(4, len(rule.get("times") or [med["time"]]))
+                    st.selectbox(f"Doses per day for {med['name']}", [1, 2, 3, 4], index=current_doses - 1,
+                                 format_func=lambda n: "Once a day" if n == 1 else f"{n} times a day",
+                                 key=f"doses_{i}", label_visibility="collapsed", on_change=set_doses, args=(i,))
+                    if med.get("rule"):
+                        st.caption(f"🔁 {describe(med['rule'])}")
             st.write("")
         st.write("")
         col1, col2, col3 = st.columns([1, 1, 1])
@@ -828,41 +527,9 @@ if "Guided" in app_mode:
         if not st.session_state.meds:
             st.info("No medicines added yet.")
         else:
-            for i, med in enumerate(sorted(st.session_state.meds, key=lambda x: x["time"])):
-                status = get_med_status(med['name'], med['time'])
-                if med['name'] in st.session_state.med_status and st.session_state.med_status[med['name']] == "taken":
-                    card_class = "med-card-taken"
-                    status_icon = "🟩 Taken"
-                    button_disabled = True
-                elif status == "missed":
-                    card_class = "med-card-missed"
-                    status_icon = "🟥 Missed"
-                    button_disabled = False
-                elif status == "due":
-                    card_class = "med-card-due"
-                    status_icon = "🔴 Due Now"
-                    button_disabled = False
-                else:
-                    card_class = "med-card"
-                    status_icon = "⏰ Upcoming"
-                    button_disabled = False
-                st.markdown(f"<div class='{card_class}'>", unsafe_allow_html=True)
-                col1, col2, col3, col4 = st.columns([3, 2, 2, 2])
-                with col1:
-                    st.markdown(f"{med['name']}")
-                with col2:
-                    st.markdown(f"🕐 {med['time']}")
-                with col3:
-                    st.markdown(f"{status_icon}")
-                with col4:
-                    if not button_disabled:
-                        if st.button(f"✅ Taken", key=f"taken_{med['name']}_{i}"):
-                            st.session_state.med_status[med['name']] = "taken"
-                            st.session_state.show_balloons = True
-                            st.success(f"🎉 Great job! You took {med['name']}")
-                            st.rerun()
-                st.markdown("</div>", unsafe_allow_html=True)
-                st.write("")
+            schedule = classify_schedule(st.session_state.meds, tz=st.session_state.profile.get("timezone"))
+            for i, (pos, time_state) in enumerate(zip(schedule.index, schedule["time_state"])):
+                dose_card(i, st.session_state.meds[pos], time_state)
         st.write("")
         st.markdown("---")
         st.markdown("### 📄 Upload Prescription")
@@ -874,7 +541,17 @@ if "Guided" in app_mode:
         """, unsafe_allow_html=True)
         report = st.file_uploader("prescription_upload", type=["pdf", "jpg", "jpeg", "png"], key="prescription", label_visibility="collapsed")
         if report:
-            st.success("✅ Prescription uploaded successfully!")
+            # The uploader keeps its file across reruns; store each upload once.
+            upload_key = getattr(report, "file_id", None) or (report.name, report.size)
+            if st.session_state.get("prescription_upload") != upload_key:
+                _, added = prescriptions.put(report.getvalue(), report.name, report.type)
+                st.session_state.prescription_upload = upload_key
+                st.session_state.prescription_added = added
+            if st.session_state.prescription_added:
+                st.success("✅ Prescription uploaded successfully!")
+            else:
+                st.info("✅ This prescription is already saved.")
+        prescription_gallery()
         st.write("")
         st.markdown("---")
         st.markdown("### 💾 Save or Restore Your Data")
@@ -882,9 +559,17 @@ if "Guided" in app_mode:
         col1, col2 = st.columns(2)
         with col1:
             st.markdown("*Download Your Data*")
-            data_to_save = {"profile": st.session_state.profile, "meds": st.session_state.meds, "med_status": st.session_state.med_status}
-            st.download_button(label="💾 Download Data", data=json.dumps(data_to_save, indent=2), 
-                             mime="application/json", file_name="medtimer_data.json", use_container_width=True, key="download_data")
+            fmt, compress = export_options("guided_export")
+            if fmt == "json":
+                data_to_save = {"profile": dict(st.session_state.profile), "meds": list(st.session_state.meds),
+                                "med_status": dict(st.session_state.med_status)}
+            else:
+                data_to_save = [{"name": med["name"], "time": med["time"],
+                                 "status": st.session_state.med_status.get(med["name"], "")}
+                                for med in st.session_state.meds]
+                st.caption("Only JSON backups can be restored.")
+            lazy_download("💾 Download Data", partial(export_file, data_to_save, fmt, ["name", "time", "status"], compress),
+                          export_name("medtimer_data", fmt, compress), export_mime(fmt, compress), key="download_data")
         with col2:
             st.markdown("*Restore from File*")
             st.markdown(f"""
@@ -892,18 +577,35 @@ if "Guided" in app_mode:
                     <p style='font-weight: 600; margin: 0; font-size: 0.9rem;'>📂 Upload saved JSON file</p>
                 </div>
             """, unsafe_allow_html=True)
-            upload = st.file_uploader("restore_upload", type="json", key="restore", label_visibility="collapsed")
+            restore_mode = st.radio("Restore mode", ["Replace my data", "Merge into my data"], horizontal=True,
+                                    key="restore_mode", label_visibility="collapsed")
+            upload = st.file_uploader("restore_upload", type=["json", "gz"], key="restore", label_visibility="collapsed")
             if upload:
-                try:
-                    loaded = json.load(upload)
-                    st.session_state.profile = loaded["profile"]
-                    st.session_state.meds = loaded["meds"]
-                    st.session_state.med_status = loaded.get("med_status", {})
-                    st.session_state.step = 1
-                    st.success("✅ Data restored!")
-                    st.rerun()
-                except Exception as e:
-                    st.error(f"❌ Could not load data: {str(e)}")
+                # The uploader returns the same file on every rerun; apply each file once.
+                data = upload.getvalue()
+                digest = content_hash(data)
+                if digest in st.session_state.restored_backups:
+                    st.info("✅ This file has already been restored.")
+                else:
+                    try:
+                        loaded = parse_backup(data)
+                    except (ValueError, OSError) as e:
+                        st.error(f"❌ Could not load data: {str(e)}")
+                    else:
+                        if "Merge" in restore_mode:
+                            profile, meds, med_status, added, updated = merge_backup(
+                                st.session_state.profile, st.session_state.meds, st.session_state.med_status, loaded)
+                            st.session_state.restore_notice = (f"✅ Data merged: {added} medicines added, "
+                                                               f"{updated} updated.")
+                        else:
+                            profile, meds, med_status = loaded["profile"], loaded["meds"], loaded["med_status"]
+                            st.session_state.step = 1
+                            st.session_state.restore_notice = "✅ Data restored!"
+                        st.session_state.profile = profile
+                        st.session_state.meds = meds
+                        st.session_state.med_status = med_status
+                        st.session_state.restored_backups.add(digest)
+                        st.rerun()
         st.write("")
         st.markdown("---")
         col1, col2, col3 = st.columns([1, 1, 1])
@@ -913,6 +615,7 @@ if "Guided" in app_mode:
                 st.rerun()
 
 else:
+    profiler.mark("quick_add_form")
     st.markdown("## ⚡ Quick Add Medicine")
     st.write("")
     st.markdown("### 📍 Select Location & Condition")
@@ -932,6 +635,19 @@ else:
     with col2:
         medicine_list = DISEASES[country][disease]
         medicine = st.selectbox("Select Medicine", medicine_list, key="quick_medicine")
+    search_query = st.text_input("🔎 Search all medicines", placeholder="Start typing, e.g. metf",
+                                 key="quick_med_search")
+    if search_query.strip():
+        matches = medicine_search.search(search_query, k=8)
+        if matches:
+            picked = st.selectbox("Matching medicines", matches, index=None,
+                                  placeholder="Pick the exact medicine", key="quick_med_match")
+            if picked:
+                medicine = picked
+            else:
+                st.caption(f"Pick a match to use it instead of {medicine}.")
+        else:
+            st.caption("No matching medicines found.")
     st.write("")
     st.markdown("---")
     st.markdown("### ⏰ Set Reminder Time")
@@ -941,143 +657,214 @@ else:
         dose_time = st.time_input("Select Reminder Time", key="quick_time")
     with col2:
         notes = st.text_input("Notes (Optional)", placeholder="e.g., Take with food", key="quick_notes")
+    first_time = dose_time.strftime("%H:%M")
+    today = local_now(timezone).date()
+    rule, rule_error = {}, None
+    with st.expander("🔁 Repeat (optional)"):
+        repeat = st.radio("Repeat", ["Once a day", "Several times a day", "Every few hours", "Tapering course"],
+                          horizontal=True, key="quick_repeat", label_visibility="collapsed")
+        if repeat == "Several times a day":
+            doses = st.selectbox("Doses per day", [2, 3, 4], key="quick_doses_per_day")
+            rule["times"] = spread_times(first_time, doses)
+        elif repeat == "Every few hours":
+            every_hours = st.selectbox("Every", EVERY_HOURS, index=2, format_func=lambda h: f"{h} hours",
+                                       key="quick_every_hours")
+            rule = {"every_hours": every_hours, "from": first_time}
+        elif repeat == "Tapering course":
+            col1, col2 = st.columns(2)
+            with col1:
+                first_doses = st.selectbox("Doses per day at first", [2, 3, 4], index=1, key="quick_taper_doses")
+            with col2:
+                step_days = st.number_input("Days at each step", min_value=1, max_value=60, value=5,
+                                            key="quick_taper_days")
+            rule["taper"] = [{"days": int(step_days), "times": spread_times(first_time, doses)}
+                             for doses in range(first_doses, 0, -1)]
+        weekdays = st.multiselect("Days", WEEKDAYS, default=WEEKDAYS, key="quick_repeat_days")
+        col1, col2 = st.columns(2)
+        with col1:
+            start_date = st.date_input("Starts", value=today, key="quick_repeat_start")
+        with col2:
+            end_date = st.date_input("Ends (optional)", value=None, key="quick_repeat_end")
+        if rule or len(weekdays) < len(WEEKDAYS) or end_date or start_date != today:
+            rule = rule or {"times": [first_time]}
+            if len(weekdays) < len(WEEKDAYS):
+                rule["weekdays"] = [WEEKDAYS.index(day) for day in weekdays]
+            rule["start"] = start_date.isoformat()
+            if end_date:
+                rule["end"] = end_date.isoformat()
+            try:
+                st.caption(f"🔁 {describe(validate_rule(rule))}")
+            except ValueError as e:
+                rule_error = str(e)
+                st.error(f"❌ {rule_error}")
     st.write("")
     col1, col2, col3 = st.columns([1, 2, 1])
     with col2:
-        if st.button("➕ Add Medicine", use_container_width=True, key="add_medicine_btn"):
-            entry = {"country": country, "state": state, "timezone": timezone, "disease": disease, 
-                    "medicine": medicine, "time": dose_time.strftime("%H:%M"), "notes": notes, "status": "Due"}
-            medicine_data.append(entry)
-            save_data(medicine_data)
+        if st.button("➕ Add Medicine", use_container_width=True, key="add_medicine_btn", disabled=rule_error is not None):
+            entry = {"id": new_id(), "country": country, "state": state, "timezone": timezone, "disease": disease, 
+                    "medicine": medicine, "time": first_time, "notes": notes, "status": "Due"}
+            if rule:
+                entry["rule"] = rule
+            store.add(entry)
             st.success(f"✅ {medicine} added successfully!")
             st.balloons()
             st.rerun()
     st.write("")
+    with st.expander("📥 Import many medicines (CSV / NDJSON)"):
+        st.markdown("Columns: *medicine, time (HH:MM), country*, and optionally "
+                    "*timezone, state, disease, notes, status, rule*.")
+        import_file = st.file_uploader("Medicine list", type=["csv", "ndjson", "jsonl"], key="bulk_import")
+        if st.button("📥 Import", use_container_width=True, key="bulk_import_btn", disabled=import_file is None):
+            try:
+                report = import_rows(store, import_file, detect_format(import_file.name))
+            except (ValueError, csv.Error) as e:
+                st.error(f"❌ Could not read {import_file.name}: {e}")
+            else:
+                if report["imported"]:
+                    st.success(f"✅ Imported {report['imported']} of {report['rows']} rows")
+                if report["error_count"]:
+                    st.warning(f"⚠ {report['error_count']} row(s) skipped"
+                               + (f" (first {len(report['errors'])} shown)"
+                                  if report["error_count"] > len(report["errors"]) else ""))
+                    st.dataframe([{"Row": number, "Problem": error} for number, error in report["errors"]],
+                                 hide_index=True, use_container_width=True)
+    st.write("")
     st.markdown("---")
     st.write("")
     st.markdown("### 💊 Your Medicines")
     st.write("")
-    if len(medicine_data) == 0:
+    counts = store.counts()
+    if counts["total"] == 0:
         st.info("🐢 No medicines added yet. Add your first medicine above!")
     else:
-        sorted_medicines = sorted(medicine_data, key=lambda x: x['time'])
-        for i, med in enumerate(sorted_medicines):
-            card_class = "med-card"
-            if med["status"] == "Taken":
-                card_class = "med-card-taken"
-                status_icon = "🟩 Taken"
-            elif med["status"] == "Missed":
-                card_class = "med-card-missed"
-                status_icon = "🟥 Missed"
-            elif med["status"] == "Due":
-                current_time = datetime.now().time()
-                med_time = datetime.strptime(med["time"], "%H:%M").time()
-                if current_time.hour == med_time.hour and abs(current_time.minute - med_time.minute) <= 30:
-                    card_class = "med-card-due"
-                    status_icon = "🔴 Due Now"
-                else:
-                    status_icon = "⏰ Scheduled"
-            st.markdown(f"<div class='{card_class}'>", unsafe_allow_html=True)
-            col1, col2, col3 = st.columns([3, 2, 2])
-            with col1:
-                st.markdown(f"💊 {med['medicine']}")
-                st.markdown(f"{med['disease']}")
-            with col2:
-                st.markdown(f"🕐 *{med['time']}*")
-                if med['notes']:
-                    st.markdown(f"📝 {med['notes']}")
-            with col3:
-                st.markdown(f"{status_icon}")
-                st.markdown(f"📍 {med['state']}")
+        list_area = st.container()
+        profiler.mark("statistics")
+        with st.container():
+            st.write("")
+            st.markdown("---")
+            st.markdown("### 📊 Your Statistics")
             st.write("")
-            col1, col2, col3, col4 = st.columns(4)
+            stats_slot = st.empty()
+            st.session_state.pop("stats_changed", None)
+            render_stats(stats_slot, store.stats())
+        with list_area:
+            profiler.mark("quick_list")
+            queue = dose_queue(store)
+            due_now = queue.due_now()
+            next_dose = queue.next_dose()
+            if due_now:
+                st.warning(f"🔔 Due now: {', '.join(med['medicine'] for _, med in due_now)}")
+            elif next_dose:
+                fire, med = next_dose
+                minutes_left = int((fire - datetime.now(fire.tzinfo)).total_seconds() // 60)
+                # The queued instant, so rule entries show the dose actually next.
+                local_fire = local_now(med["timezone"], fire)
+                when = local_fire.strftime("%H:%M" if local_fire.date() == local_now(med["timezone"]).date()
+                                           else "%a %H:%M")
+                st.info(f"⏭ Next dose: {med['medicine']} at {when} ({med['timezone']}), "
+                        f"in {minutes_left // 60}h {minutes_left % 60}m")
+            col1, col2 = st.columns(2)
             with col1:
-                if med["status"] != "Taken":
-                    if st.button("✅ Mark Taken", key=f"taken_quick_{i}", use_container_width=True):
-                        medicine_data[medicine_data.index(med)]["status"] = "Taken"
-                        save_data(medicine_data)
-                        st.balloons()
-                        st.rerun()
+                page_size = st.selectbox("Medicines per page", PAGE_SIZES, index=1, key="quick_page_size")
             with col2:
-                if med["status"] != "Missed":
-                    if st.button("🟥 Mark Missed", key=f"missed_quick_{i}", use_container_width=True):
-                        medicine_data[medicine_data.index(med)]["status"] = "Missed"
-                        save_data(medicine_data)
+                st.write("")
+                st.write("")
+                around_now = st.checkbox(f"Only doses within {WINDOW_HOURS} hours of now", key="quick_around_now")
+            window_start, window_end = None, None
+            if around_now:
+                now = local_now(timezone)
+                window_start = (now - timedelta(hours=WINDOW_HOURS)).strftime("%H:%M")
+                window_end = (now + timedelta(hours=WINDOW_HOURS)).strftime("%H:%M")
+            shown_total = store.count_entries(window_start, window_end)
+            page_count = max(1, -(-shown_total // page_size))
+            page = min(st.session_state.quick_page, page_count - 1)
+            page_entries = store.entries(page * page_size, page_size, window_start, window_end)
+            st.write("")
+            if not page_entries:
+                st.info("🐢 No doses scheduled around this time.")
+            schedule = classify_schedule(page_entries, mode="quick", tz=timezone)
+            for pos, time_state in zip(schedule.index, schedule["time_state"]):
+                quick_card(page_entries[pos]["id"], time_state, stats_slot)
+            if page_count > 1:
+                col1, col2, col3 = st.columns([1, 2, 1])
+                with col1:
+                    if st.button("← Previous", use_container_width=True, key="quick_prev_page", disabled=page == 0):
+                        st.session_state.quick_page = page - 1
                         st.rerun()
-            with col3:
-                if med["status"] != "Due":
-                    if st.button("🔄 Reset", key=f"reset_quick_{i}", use_container_width=True):
-                        medicine_data[medicine_data.index(med)]["status"] = "Due"
-                        save_data(medicine_data)
+                with col2:
+                    st.markdown(f"<p style='text-align:center;'>Page {page + 1} of {page_count} ({shown_total} medicines)</p>", unsafe_allow_html=True)
+                with col3:
+                    if st.button("Next →", use_container_width=True, key="quick_next_page", disabled=page == page_count - 1):
+                        st.session_state.quick_page = page + 1
                         st.rerun()
-            with col4:
-                if st.button("🗑 Delete", key=f"delete_quick_{i}", use_container_width=True):
-                    medicine_data.pop(medicine_data.index(med))
-                    save_data(medicine_data)
-                    st.success("Medicine deleted!")
-                    st.rerun()
-            st.markdown("</div>", unsafe_allow_html=True)
-            st.write("")
+        profiler.mark("history")
         st.write("")
-        st.markdown("---")
-        st.markdown("### 📊 Your Statistics")
-        st.write("")
-        total_meds = len(medicine_data)
-        taken_count = sum(1 for m in medicine_data if m["status"] == "Taken")
-        missed_count = sum(1 for m in medicine_data if m["status"] == "Missed")
-        due_count = sum(1 for m in medicine_data if m["status"] == "Due")
-        col1, col2, col3, col4 = st.columns(4)
-        with col1:
-            st.markdown(f"""
-                <div style='background: {theme['card_bg']}; border: 2.5px solid {theme['primary']}; 
-                border-radius: 12px; padding: 20px; text-align: center;'>
-                    <h2 style='margin: 0;'>{total_meds}</h2>
-                    <p style='margin: 5px 0 0 0;'>Total</p>
-                </div>
-            """, unsafe_allow_html=True)
-        with col2:
-            st.markdown(f"""
-                <div style='background: linear-gradient(135deg, #E8F5E9 0%, #C8E6C9 100%); 
-                border: 2.5px solid #66BB6A; border-radius: 12px; padding: 20px; text-align: center;'>
-                    <h2 style='margin: 0; color: #2E7D32;'>{taken_count}</h2>
-                    <p style='margin: 5px 0 0 0; color: #2E7D32;'>Taken</p>
-                </div>
-            """, unsafe_allow_html=True)
-        with col3:
-            st.markdown(f"""
-                <div style='background: linear-gradient(135deg, #FFEBEE 0%, #FFCDD2 100%); 
-                border: 2.5px solid #EF5350; border-radius: 12px; padding: 20px; text-align: center;'>
-                    <h2 style='margin: 0; color: #C62828;'>{missed_count}</h2>
-                    <p style='margin: 5px 0 0 0; color: #C62828;'>Missed</p>
-                </div>
-            """, unsafe_allow_html=True)
-        with col4:
-            st.markdown(f"""
-                <div style='background: linear-gradient(135deg, #FFFDE7 0%, #FFF9C4 100%); 
-                border: 2.5px solid #FFCA28; border-radius: 12px; padding: 20px; text-align: center;'>
-                    <h2 style='margin: 0; color: #F57F17;'>{due_count}</h2>
-                    <p style='margin: 5px 0 0 0; color: #F57F17;'>Due</p>
-                </div>
-            """, unsafe_allow_html=True)
+        if st.checkbox("🗓 Show dose history", key="show_history"):
+            col1, col2 = st.columns(2)
+            with col1:
+                history_days = st.selectbox("Period", [7, 30, 90, 365], index=1,
+                                            format_func=lambda d: f"Last {d} days", key="history_days")
+            history = read_history(datetime.now().astimezone() - timedelta(days=history_days), root=history_root)
+            with col2:
+                medicine_names = ["All medicines"] + sorted(history["medicine"].unique().tolist())
+                history_medicine = st.selectbox("Medicine", medicine_names, key="history_medicine")
+            if history_medicine != "All medicines":
+                history = history[history["medicine"] == history_medicine]
+            if history.empty:
+                st.info("🐢 No doses recorded in this period yet.")
+            else:
+                st.dataframe(history[["ts", "medicine", "previous", "status"]].rename(
+                    columns={"ts": "When", "medicine": "Medicine", "previous": "From", "status": "To"}),
+                    hide_index=True, use_container_width=True)
+        profiler.mark("backup")
         st.write("")
         st.markdown("### 💾 Backup & Restore")
         st.write("")
         col1, col2 = st.columns(2)
         with col1:
             st.markdown("*Download All Data*")
-            st.download_button(label="💾 Download JSON", data=json.dumps(medicine_data, indent=2), 
-                             mime="application/json", file_name="medtimer_medicines.json", 
-                             use_container_width=True, key="download_all_data")
+            fmt, compress = export_options("quick_export")
+            lazy_download("💾 Download Medicines", partial(export_file, store.iter_entries, fmt, FIELDS + ["rule"], compress),
+                          export_name("medtimer_medicines", fmt, compress), export_mime(fmt, compress),
+                          key="download_all_data")
+            if has_history(history_root):
+                export_days = st.selectbox("History period", [7, 30, 90, 365], index=1,
+                                           format_func=lambda d: f"Last {d} days", key="export_history_days")
+                history_start = datetime.now().astimezone() - timedelta(days=export_days)
+                lazy_download("🗓 Download History",
+                              partial(export_file, partial(iter_history, history_start, root=history_root), fmt,
+                                      HISTORY_COLUMNS, compress),
+                              export_name("medtimer_history", fmt, compress), export_mime(fmt, compress),
+                              key="download_history")
         with col2:
             st.markdown("*Clear All Data*")
             if st.button("🗑 Clear All Medicines", use_container_width=True, key="clear_all"):
-                medicine_data.clear()
-                save_data(medicine_data)
+                store.clear()
                 st.success("✅ All medicines cleared!")
                 st.rerun()
 
+profiler.mark("footer")
 st.write("")
 st.write("")
 st.markdown("---")
 st.markdown(f"<h3 style='text-align:center;'>{theme['icon']} Slow and steady wins the health race! {theme['icon']}</h3>", unsafe_allow_html=True)
-st.markdown("<p style='text-align:center; opacity: 0.7;'>Made with 💚 for your health journey</p>", unsafe_allow_html=True)
\ No newline at end of file
+st.markdown("<p style='text-align:center; opacity: 0.7;'>Made with 💚 for your health journey</p>", unsafe_allow_html=True)
+
+if profiler.enabled:
+    run = profiler.finish(mode="guided" if "Guided" in app_mode else "quick")
+    if TRACE_FILE:
+        write_trace(TRACE_FILE, run)
+    if st.session_state.get("profiling"):
+        runs = st.session_state.setdefault("profile_runs", [])
+        runs.append(run)
+        del runs[:-PROFILE_RUNS]
+        with st.sidebar.expander("⏱ Rerun profile", expanded=True):
+            st.markdown(f"*Last rerun: {run['total_ms']:.1f} ms*")
+            st.dataframe([{"Section": name, "ms": section["ms"], "Elements": section["elements"]}
+                          for name, section in run["sections"].items()],
+                         hide_index=True, use_container_width=True)
+            st.markdown(f"*Last {len(runs)} reruns (ms)*")
+            st.dataframe([dict({"total": past["total_ms"]},
+                               **{name: section["ms"] for name, section in past["sections"].items()})
+                          for past in reversed(runs)],
+                         hide_index=True, use_container_width=True)